@@ -0,0 +1,80 @@
+# Articulation points of the graph of the empty cells : the empty cells that split their zone in several parts
+# when they are filled. A pipe whose ends touch different parts must go through the articulation point,
+# and an articulation point is a cut of a single cell, so it can be crossed by a single pipe.
+# The articulation points are found in linear time with Tarjan's algorithm (iterative DFS, so the recursion
+# limit does not apply to big grids), and the DFS tree tells on which side of an articulation point a cell is :
+# the subtree of a child of the articulation point that has no back edge above it is cut from the rest of the zone.
+
+
+def adjacent_cells(cell: tuple) -> list:
+    (i, j) = cell
+    return [(i - 1, j), (i, j + 1), (i + 1, j), (i, j - 1)]
+
+
+class ArticulationPoints:
+    def __init__(self, empty_cells: set):
+        self.disc = dict()       # DFS discovery time of each cell
+        self.last = dict()       # last discovery time in the DFS subtree of each cell
+        self.root = dict()       # DFS root of the zone of each cell
+        self.separated = dict()  # articulation point -> children whose subtree is cut from the zone without it
+
+        low = dict()
+        parent = dict()
+        time = 0
+        for start in sorted(empty_cells):
+            if start in self.disc:
+                continue
+            self.disc[start] = low[start] = time
+            time += 1
+            self.root[start] = start
+            parent[start] = None
+            root_children = []
+            stack = [(start, iter(adjacent_cells(start)))]
+            while len(stack) > 0:
+                (cell, neighbours) = stack[-1]
+                for adj in neighbours:
+                    if adj not in empty_cells:
+                        continue
+                    if adj not in self.disc:
+                        self.disc[adj] = low[adj] = time
+                        time += 1
+                        self.root[adj] = start
+                        parent[adj] = cell
+                        stack.append((adj, iter(adjacent_cells(adj))))
+                        break
+                    if adj != parent[cell]:
+                        low[cell] = min(low[cell], self.disc[adj])
+                else:
+                    # all the neighbours of the cell are explored
+                    stack.pop()
+                    self.last[cell] = time - 1
+                    up = parent[cell]
+                    if up is None:
+                        continue
+                    low[up] = min(low[up], low[cell])
+                    if up == start:
+                        root_children.append(cell)
+                    elif low[cell] >= self.disc[up]:
+                        self.separated.setdefault(up, []).append(cell)
+            # the DFS root is an articulation point if it has several children
+            if len(root_children) > 1:
+                self.separated[start] = root_children
+
+    def points(self) -> list:
+        return list(self.separated.keys())
+
+    def side(self, cell: tuple, point: tuple) -> tuple:
+        """Part of the empty cells containing the cell when the articulation point is filled :
+        the separated child subtree containing the cell, else the DFS root of the zone of the cell"""
+        if self.disc[point] < self.disc[cell] <= self.last[point]:
+            for child in self.separated[point]:
+                if self.disc[child] <= self.disc[cell] <= self.last[child]:
+                    return child
+        return self.root[cell]
+
+    def must_cross(self, point: tuple, start_cells: list, end_cells: list) -> bool:
+        """True if a pipe entering the empty cells by one of the start cells and leaving them by one of the end cells
+        has to go through the articulation point"""
+        start_sides = {self.side(cell, point) for cell in start_cells if cell != point}
+        end_sides = {self.side(cell, point) for cell in end_cells if cell != point}
+        return len(start_sides & end_sides) == 0
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+
+from utils import setup_logging
+from pipe_engine import PipeEngine
+from shortest_path_engine import ShortestPathEngine
+from samples import Samples
+
+# Streaming API to drive the pipe engines from an asyncio event loop :
+#
+#     async for batch in solve_stream(Samples.get_puzzle("9")):
+#         for move in batch:
+#             ...
+#
+# The engine runs by chunks of a fixed number of steps, each chunk producing a batch of moves.
+# Chunks run either cooperatively in the event loop thread (which is released after every chunk),
+# or in an executor so the event loop is never blocked by the engine.
+# A producer task pushes the batches to a bounded queue, so a slow consumer throttles the engine (backpressure),
+# and cancelling the consuming task cancels the resolution after the current chunk.
+
+DEFAULT_CHUNK_STEPS = 50     # engine steps per batch of moves
+DEFAULT_MAX_PENDING = 2      # batches computed in advance for the consumer
+COOPERATIVE = "cooperative"  # run the engine in the event loop thread instead of an executor
+
+
+def run_chunk(engine: PipeEngine, steps: int):
+    """Run up to a given number of engine steps, return the moves and whether the resolution is over"""
+    moves = []
+    for _ in range(steps):
+        next_moves = engine.next_moves()
+        if len(next_moves) == 0:
+            # the maze has no solution, or the engine gave up (engine.incomplete)
+            return moves, True
+        moves += next_moves
+        if engine.solved:
+            return moves, True
+    return moves, False
+
+
+async def stream_engine(engine: PipeEngine, chunk_steps: int = DEFAULT_CHUNK_STEPS, executor=None,
+                        max_pending: int = DEFAULT_MAX_PENDING):
+    """Asynchronously yield the batches of moves of an engine until it is solved or has no solution.
+    The chunks run in the given executor (the default executor of the loop if None), or in the event loop
+    thread if executor is COOPERATIVE."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max(1, max_pending))
+
+    async def produce():
+        done = False
+        while not done:
+            if executor == COOPERATIVE:
+                moves, done = run_chunk(engine, chunk_steps)
+                # let the other tasks of the event loop run between 2 chunks
+                await asyncio.sleep(0)
+            else:
+                moves, done = await loop.run_in_executor(executor, run_chunk, engine, chunk_steps)
+            # wait here while the consumer is busy with the previous batches
+            await queue.put((moves, done))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            get = asyncio.create_task(queue.get())
+            # wake up on a new batch, or if the producer failed
+            await asyncio.wait([get, producer], return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                producer.result()  # raise the producer exception
+                return
+            (moves, done) = get.result()
+            if len(moves) > 0:
+                yield moves
+            if done:
+                return
+    finally:
+        producer.cancel()
+
+
+async def solve_stream(puzzle: tuple, engine_factory=ShortestPathEngine, chunk_steps: int = DEFAULT_CHUNK_STEPS,
+                       executor=None, max_pending: int = DEFAULT_MAX_PENDING):
+    """Asynchronously yield the batches of moves to solve a puzzle given as (grid_size, pipe_ends)"""
+    (grid_size, pipe_ends) = puzzle
+    engine = engine_factory(grid_size, pipe_ends)
+    async for batch in stream_engine(engine, chunk_steps, executor, max_pending):
+        yield batch
+
+
+async def solve(puzzle: tuple, engine_factory=ShortestPathEngine, chunk_steps: int = DEFAULT_CHUNK_STEPS,
+                executor=None):
+    """Solve a puzzle given as (grid_size, pipe_ends), return the final paths or None if it has no solution"""
+    (grid_size, pipe_ends) = puzzle
+    engine = engine_factory(grid_size, pipe_ends)
+    async for _batch in stream_engine(engine, chunk_steps, executor):
+        pass
+    return engine.final_paths() if engine.solved else None
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+
+    async def count_moves(name: str, executor):
+        moves_number = 0
+        async for batch in solve_stream(Samples.get_puzzle(name), executor=executor):
+            moves_number += len(batch)
+        logging.info("Sample {0} solved in {1} moves".format(name, moves_number))
+
+    async def main():
+        # several resolutions driven concurrently by the same event loop
+        await asyncio.gather(count_moves("9", None), count_moves("10", None), count_moves("11", COOPERATIVE))
+
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+import argparse
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import setup_logging
+from point import Point
+from puzzle_io import puzzle_to_json, puzzle_from_json
+from solver_server import solve_puzzle, SOLVED
+from samples import SAMPLES
+
+# Batch resolution of many puzzles on a pool of worker processes.
+# Solve times span orders of magnitude between a small and a big grid, so with the puzzles started in the order
+# they are given, a slow puzzle started last sets the end time of the whole batch (makespan).
+# The scheduler starts the puzzles expected to be the longest first (longest processing time first), using a cost
+# model estimating the solve time of a puzzle from cheap features :
+#  - grid size and number of pipes
+#  - contact of the pipe ends with the walls, counted like in the pipe score of the shortest-path engine
+#  - Manhattan spans between the ends of the pipes
+# The model is linear on the logarithm of the solve time, and is calibrated by least squares on the solve times
+# of the previous batches, stored in a JSON history file.
+# Each puzzle gets a time budget adapted to its estimation : the estimated time widened by the spread of the
+# estimation errors seen in the history, within MIN_BUDGET and MAX_BUDGET.
+# With more processes than cores, the solves share the cores : the budgets are widened by the contention
+# (processes per core), and the solve times are recorded divided by it, so the model estimates the time on a free core.
+# A puzzle whose solve fails gets the ERROR status, without stopping the batch.
+
+DEFAULT_HISTORY_FILE = "batch_history.json"
+MIN_RECORDS = 10            # solved puzzles in the history before the model is calibrated on them
+RIDGE = 1.0                 # regularization of the least squares, for short histories or similar puzzles
+BUDGET_SIGMAS = 3.0         # budget = estimation * exp(BUDGET_SIGMAS * standard deviation of the log errors)
+MIN_BUDGET = 2.0            # seconds
+MAX_BUDGET = 300.0          # seconds
+DEFAULT_LOG_ERROR = 0.8     # standard deviation of the log errors before calibration
+ERROR = "error"             # status of a puzzle whose solve raised an exception
+
+# log(seconds) = coefficients . features, fitted on the samples before any history is available
+DEFAULT_COEFFICIENTS = [-11.57, 0.155, 0.351, 0.666, 0.069, 0.148]
+
+
+def cost_features(grid_size: int, pipe_ends: list) -> list:
+    """Features of the cost model : 1 (intercept), grid size, number of pipes, mean number of walls next to
+    the most walled end of each pipe, mean and max Manhattan span between the ends of the pipes"""
+    def walls(p: Point) -> int:
+        return len([adj for adj in p.adjacent_points()
+                    if not (0 <= adj.x < grid_size and 0 <= adj.y < grid_size)])
+
+    pipes = max(len(pipe_ends), 1)
+    spans = [abs(start.x - end.x) + abs(start.y - end.y) for (start, end) in pipe_ends] or [0]
+    wall_contact = sum(max(walls(start), walls(end)) for (start, end) in pipe_ends) / pipes
+    return [1.0, grid_size, len(pipe_ends), wall_contact, sum(spans) / pipes, max(spans)]
+
+
+def solve_linear(matrix: list, vector: list) -> list:
+    """Solve a square linear system by Gaussian elimination with partial pivoting"""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            raise Exception("Singular system")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    res = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        res[r] = (rows[r][n] - sum(rows[r][c] * res[c] for c in range(r + 1, n))) / rows[r][r]
+    return res
+
+
+def fit_least_squares(features: list, targets: list, ridge: float = RIDGE) -> list:
+    """Coefficients minimizing the squared errors (normal equations, the intercept is not regularized)"""
+    n = len(features[0])
+    matrix = [[sum(f[i] * f[j] for f in features) + (ridge if i == j and i > 0 else 0.0) for j in range(n)]
+              for i in range(n)]
+    vector = [sum(f[i] * t for (f, t) in zip(features, targets)) for i in range(n)]
+    return solve_linear(matrix, vector)
+
+
+class CostModel:
+    """Estimation of the solve time of a puzzle, calibrated on the solve times stored in a JSON history file
+    (only kept in memory if file_path is None)"""
+    def __init__(self, file_path: str = None):
+        self.file_path = file_path
+        self.records = []
+        if file_path is not None and os.path.exists(file_path):
+            with open(file_path) as f:
+                self.records = json.load(f)
+        self.coefficients = DEFAULT_COEFFICIENTS
+        self.log_error = DEFAULT_LOG_ERROR
+        self.fit()
+
+    def fit(self):
+        """Calibrate the model on the history, once it has enough records"""
+        if len(self.records) < MIN_RECORDS:
+            return
+        features = [record["features"] for record in self.records]
+        targets = [math.log(max(record["time"], 1e-4)) for record in self.records]
+        self.coefficients = fit_least_squares(features, targets)
+        errors = [target - self.log_estimate(f) for (f, target) in zip(features, targets)]
+        self.log_error = math.sqrt(sum(e * e for e in errors) / len(errors))
+
+    def log_estimate(self, features: list) -> float:
+        return sum(c * f for (c, f) in zip(self.coefficients, features))
+
+    def estimate(self, grid_size: int, pipe_ends: list) -> float:
+        """Estimated solve time in seconds"""
+        return math.exp(self.log_estimate(cost_features(grid_size, pipe_ends)))
+
+    def budget(self, grid_size: int, pipe_ends: list, contention: float = 1.0) -> float:
+        """Time budget of a puzzle : its estimation widened by the spread of the estimation errors,
+        and by the contention when several solves share a core"""
+        budget = self.estimate(grid_size, pipe_ends) * math.exp(BUDGET_SIGMAS * self.log_error) * contention
+        return min(max(budget, MIN_BUDGET * contention), MAX_BUDGET)
+
+    def record(self, grid_size: int, pipe_ends: list, solve_time: float):
+        self.records.append({"features": cost_features(grid_size, pipe_ends), "time": solve_time})
+
+    def save(self):
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.records, f, indent=1)
+        os.replace(tmp_path, self.file_path)
+
+
+def timed_solve(puzzle: dict, budget: float) -> dict:
+    """Solve a JSON puzzle in a worker process within its budget, and measure the solve time"""
+    start = time.monotonic()
+    # the budget starts when the worker picks the puzzle, not when the batch is submitted
+    result = solve_puzzle(puzzle, time.time() + budget)
+    result["time"] = time.monotonic() - start
+    return result
+
+
+def longest_first(puzzles: list, model: CostModel) -> list:
+    """Indexes of the puzzles by decreasing estimated solve time"""
+    estimations = [model.estimate(grid_size, pipe_ends) for (grid_size, pipe_ends) in puzzles]
+    return sorted(range(len(puzzles)), key=lambda i: -estimations[i])
+
+
+def run_batch(puzzles: list, processes: int = None, model: CostModel = None, schedule: bool = True) -> list:
+    """Solve a list of (grid_size, pipe_ends) puzzles, the longest ones first if schedule is True.
+    Return the result of each puzzle in the given order : {"status", "paths", "time", "budget"}, with an "error"
+    entry and no time if the status is ERROR.
+    The solve times are added to the history of the model, which is calibrated again (and saved if it has a file)."""
+    model = model or CostModel(None)
+    order = longest_first(puzzles, model) if schedule else list(range(len(puzzles)))
+    cores = os.cpu_count() or 1
+    contention = max(1.0, (processes or cores) / cores)
+    results = [None] * len(puzzles)
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # the pool starts the puzzles in the order they are submitted
+        futures = []
+        for i in order:
+            (grid_size, pipe_ends) = puzzles[i]
+            budget = model.budget(grid_size, pipe_ends, contention)
+            futures.append((i, budget, pool.submit(timed_solve, puzzle_to_json(grid_size, pipe_ends), budget)))
+        for (i, budget, future) in futures:
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logging.exception("Puzzle {0} failed".format(i))
+                results[i] = {"status": ERROR, "error": str(e), "time": None}
+            results[i]["budget"] = budget
+    logging.info("Batch of {0} puzzles solved in {1:.3f}s".format(len(puzzles), time.monotonic() - start))
+
+    for (puzzle, result) in zip(puzzles, results):
+        # puzzles stopped by their budget only give a lower bound of their solve time, they are not recorded
+        if result["status"] == SOLVED:
+            model.record(puzzle[0], puzzle[1], result["time"] / contention)
+    model.fit()
+    if model.file_path is not None:
+        model.save()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a batch of puzzles, the longest ones first")
+    parser.add_argument("--corpus", help="JSON lines file of puzzles, the samples if not given")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--history", default=DEFAULT_HISTORY_FILE)
+    parser.add_argument("--fifo", action="store_true", help="start the puzzles in the given order")
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    if args.corpus is not None:
+        with open(args.corpus) as f:
+            batch = [puzzle_from_json(json.loads(line)) for line in f if line.strip() != ""]
+    else:
+        batch = [(sample["size"], sample["pipes"]) for sample in SAMPLES.values()]
+    cost_model = CostModel(args.history)
+    for (puzzle, puzzle_result) in zip(batch, run_batch(batch, args.processes, cost_model, not args.fifo)):
+        if puzzle_result["status"] == ERROR:
+            logging.info("{0}x{0} with {1} pipes : {2} ({3})".format(
+                puzzle[0], len(puzzle[1]), puzzle_result["status"], puzzle_result["error"]))
+            continue
+        logging.info("{0}x{0} with {1} pipes : {2} in {3:.3f}s (budget {4:.1f}s)".format(
+            puzzle[0], len(puzzle[1]), puzzle_result["status"], puzzle_result["time"], puzzle_result["budget"]))
@@ -0,0 +1,161 @@
+import logging
+import time
+
+from utils import setup_logging
+from pipe_engine import PipeEngine
+from shortest_path_engine import ShortestPathEngine
+from samples import Samples
+
+# Anytime engine for grids too big for an exact search.
+# The pipes are connected one at a time like in the shortest-path engine, but instead of backtracking over
+# all the possible paths, only the best partial states are kept for each number of connected pipes (the beam).
+# The children of a state are the first paths found for its next pipe by the shortest-path engine
+# (so they are not doomed), and states are ranked by the sum of the shortest distances between the ends of
+# their remaining pipes.
+# When a pass ends without a complete solution and there is time left, a new pass runs with a wider beam
+# and more steps to find the children of each state.
+# When the time is over, the best state found is replayed : the complete solution if any, else the
+# partial state with the most connected pipes, and the engine is incomplete unless the last pass kept all the states.
+
+DEFAULT_BEAM_WIDTH = 4      # states kept for each number of connected pipes in the first pass
+DEFAULT_TIME_LIMIT = 10.0   # seconds
+EXPANSION_STEPS = 200       # shortest-path engine steps to find the children of a state in the first pass
+
+
+class PipeCandidates(ShortestPathEngine):
+    """Shortest-path engine restored to a partial state, listing the next states with one more connected pipe"""
+    def __init__(self, grid_size: int, pipe_ends: list, connected: list):
+        super().__init__(grid_size, pipe_ends)
+        # connected pipes of the state, as (original pipe id, points)
+        for (i, (pipe_id, points)) in enumerate(connected):
+            self.swap_pipes(self.position(pipe_id), i)
+            self.paths.append([(point, []) for point in points])
+            for point in points:
+                self.universe[point.x, point.y] = str(pipe_id)
+        self.curr_pipe = len(connected)
+        self.dead = False
+        self.truncated = False  # some children were not listed
+
+    def rollback(self) -> bool:
+        # no more possible paths for the next pipe, the state is not reverted
+        self.dead = True
+        return True
+
+    def next_states(self, limit: int, max_steps: int, deadline: float) -> list:
+        """Up to limit next states as (connected pipes, score), in the order of the shortest-path engine"""
+        pipe = self.curr_pipe
+        states = []
+        for _ in range(max_steps):
+            if time.monotonic() > deadline:
+                break
+            self.step()
+            if self.dead:
+                return states
+            if self.curr_pipe > pipe or self.solved:
+                states.append((self.connected(), self.score()))
+                if self.solved or not self.possibles.exist(pipe) or len(states) == limit:
+                    # a pipe connected along the walls has no alternative
+                    self.truncated = self.possibles.exist(pipe) and not self.solved
+                    return states
+                # look for the next path of the same pipe
+                self.solved = False
+                self.curr_pipe = pipe
+        self.truncated = True
+        return states
+
+    def connected(self) -> list:
+        completed = len(self.paths) if self.solved else self.curr_pipe
+        return [(self.original_id(i), [point for (point, _moves) in self.paths[i]]) for i in range(completed)]
+
+    def score(self) -> int:
+        """Sum of the shortest distances between the ends of the remaining pipes (lower is better)"""
+        score = 0
+        for i in range(self.curr_pipe if not self.solved else len(self.pipe_ends), len(self.pipe_ends)):
+            (start, end) = self.pipe_ends[self.original_id(i)]
+            score += self.shortest_path(start, end, self.original_id(i))
+        return score
+
+
+class BeamSearchEngine(PipeEngine):
+    def __init__(self, grid_size: int, pipe_ends: list, beam_width: int = DEFAULT_BEAM_WIDTH,
+                 time_limit: float = DEFAULT_TIME_LIMIT):
+        super().__init__(grid_size, pipe_ends)
+        self.beam_width = beam_width
+        self.time_limit = time_limit
+        self.best = None          # best state found, as a list of (original pipe id, points)
+        self.connected_pipes = []  # original ids of the pipes connected in the best state
+        self.passes = 0
+        self.exhaustive = False    # no state was left out of the last pass
+
+    def step(self) -> bool:
+        if self.best is None:
+            self.best = self.search(time.monotonic() + self.time_limit)
+            self.connected_pipes = sorted(pipe_id for (pipe_id, _points) in self.best)
+            logging.info("Connected pipes : {0} / {1} {2}".format(
+                len(self.connected_pipes), len(self.pipe_ends), self.connected_pipes))
+
+        # replay the best state one connected pipe at a time, the other pipes only have their start
+        solution = dict(self.best)
+        while len(self.paths) < len(self.pipe_ends):
+            pipe_id = len(self.paths)
+            if pipe_id not in solution:
+                self.paths.append([(self.pipe_ends[pipe_id][0], [])])
+                continue
+            self.replay_path(pipe_id, solution[pipe_id])
+            break
+        if len(self.connected_pipes) == len(self.pipe_ends) and len(self.paths) == len(self.pipe_ends):
+            logging.info("Pipe puzzle solved")
+            self.solved = True
+        if len(self.paths) == len(self.pipe_ends) and not self.solved:
+            # the best state is partial : the maze has no solution only if the last pass left no state out
+            self.incomplete = not self.exhaustive
+            return False
+        return True
+
+    def search(self, deadline: float) -> list:
+        """Beam search passes with a wider beam each time until a solution is found or the deadline is reached"""
+        best = []
+        width = self.beam_width
+        while True:
+            self.passes += 1
+            logging.debug("Beam search pass {0} with a beam width of {1}".format(self.passes, width))
+            (state, self.exhaustive) = self.beam_pass(width, deadline)
+            if len(state) > len(best):
+                best = state
+            if len(best) == len(self.pipe_ends) or self.exhaustive or time.monotonic() > deadline:
+                return best
+            width *= 2
+
+    def beam_pass(self, width: int, deadline: float) -> tuple:
+        """Return the deepest state found with this beam width, and if no state was left out of the search"""
+        beam = [([], 0)]
+        best = []
+        max_steps = EXPANSION_STEPS * width // self.beam_width
+        exhaustive = True
+        while len(beam) > 0:
+            children = []
+            for (state, _score) in beam:
+                if time.monotonic() > deadline:
+                    return best, False
+                candidates = PipeCandidates(self.grid_size, self.pipe_ends, state)
+                children += candidates.next_states(width, max_steps, deadline)
+                exhaustive = exhaustive and not candidates.truncated
+            if len(children) == 0:
+                break
+            # keep the states with the most connected pipes, then with the lowest score
+            children.sort(key=lambda child: (-len(child[0]), child[1]))
+            if len(children) > width:
+                exhaustive = False
+            beam = children[:width]
+            best = beam[0][0]
+            if len(best) == len(self.pipe_ends):
+                break
+        return best, exhaustive
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    (size, pipes) = Samples.get_puzzle("13-2")
+    engine = BeamSearchEngine(size, pipes, time_limit=5.0)
+    engine.run_to_completion()
+    logging.info(engine.display())
@@ -1,19 +1,20 @@
 import logging
+from typing import Optional
+
 from utils import setup_logging
-from pipe_engine import PipeEngine, Move, GROW, SHRINK, ROLLBACK
+from pipe_engine import PipeEngine, GROW, SHRINK, ROLLBACK
 from point import Point
 
 
 class BruteForceEngine(PipeEngine):
     def __init__(self, grid_size: int, pipe_ends: list):
         super().__init__(grid_size, pipe_ends)
-        self.curr_pipe = 0
+        self.corridor_cells = 0  # cells grown in corridors, without checking the grid
 
-    def next_moves(self) -> [Move]:
+    def step(self) -> bool:
         # Hook before brute-force resolution
-        moves = self.begin_next_moves_hook()
-        if len(moves) > 0:
-            return moves
+        if self.begin_next_moves_hook():
+            return True
 
         # initialize the new pipe to try to connect
         if len(self.paths) == self.curr_pipe:
@@ -24,69 +25,79 @@ class BruteForceEngine(PipeEngine):
         curr_point, moves = self.paths[self.curr_pipe][-1]
         if len(moves) == 0 or self.is_doomed():
             # no possible move from here, revert the last move
-            return self.shrink()
+            return self.shrink() is not None
         else:
-            # perform a move
+            # perform a move, and keep moving while the pipe head has a single way out (corridor),
+            # so the grid is only checked at junction cells
             next_point = self.choose_next_point(moves)
             original_pipe_id = self.original_id(self.curr_pipe)
-            self.universe[next_point.x, next_point.y] = str(original_pipe_id)
-            if next_point != self.pipe_ends[original_pipe_id][1]:
+            while True:
+                self.universe[next_point.x, next_point.y] = str(original_pipe_id)
+                if next_point == self.pipe_ends[original_pipe_id][1]:
+                    break
                 next_cells = self.possible_dirs(next_point, original_pipe_id)
-                next_cells = self.filter_next_cells(next_cells)
+                next_cells = self.filter_next_cells(next_point, next_cells)
                 self.paths[self.curr_pipe].append((next_point, next_cells))
-                return [Move(GROW, original_pipe_id, next_point)]
-            else:
-                # target reached
-                logging.debug("Reached the goal for pipe " + str(original_pipe_id))
-                self.paths[self.curr_pipe].append((next_point, []))
-                if self.curr_pipe < len(self.pipe_ends) - 1:
-                    # move to next pipe
-                    self.curr_pipe += 1
-                    return [Move(GROW, original_pipe_id, next_point)]
-                else:
-                    logging.info("Pipe puzzle solved")
-                    self.solved = True
-                    self.display()
-                    return [Move(GROW, original_pipe_id, next_point)]
+                self.emit(GROW, original_pipe_id, next_point)
+                if len(next_cells) != 1:
+                    return True
+                self.corridor_cells += 1
+                next_point = self.choose_next_point(next_cells)
 
-    def shrink(self) -> [Move]:
+            # target reached
+            logging.debug("Reached the goal for pipe " + str(original_pipe_id))
+            self.paths[self.curr_pipe].append((next_point, []))
+            if self.curr_pipe < len(self.pipe_ends) - 1:
+                # move to next pipe
+                self.curr_pipe += 1
+            elif self.add_solution():
+                logging.info("Pipe puzzle solved")
+                self.display()
+            self.emit(GROW, original_pipe_id, next_point)
+            return True
+
+    def shrink(self) -> Optional[str]:
+        """Revert the last move, return the type of the move performed or None if there is no solution"""
         if self.curr_pipe < 0:
             # The maze has no solution
-            return []
+            return None
         point_to_shrink, _moves = self.paths[self.curr_pipe].pop()
         if len(self.paths[self.curr_pipe]) > 0:
             # remove the current point from the universe
             logging.debug("We are blocked, shrink the current pipe")
             if point_to_shrink != self.pipe_ends[self.original_id(self.curr_pipe)][1]:
                 self.universe[point_to_shrink.x, point_to_shrink.y] = '.'
-            return [Move(SHRINK, self.original_id(self.curr_pipe), point_to_shrink)]
+            self.emit(SHRINK, self.original_id(self.curr_pipe), point_to_shrink)
+            return SHRINK
         else:
             # roll back the origin of the current pipe, so we remove this pipe from the state
             # and remove the last point of the path of the previous pipe
             logging.debug("We are blocked, rollback the current pipe to modify the previous pipe")
             self.paths.pop()
             self.curr_pipe -= 1
+            self.rollbacks += 1
             if len(self.paths) == 0:
                 # The maze has no solution
-                return []
+                return None
             else:
                 self.paths[-1].pop()
-                return [Move(ROLLBACK, self.original_id(self.curr_pipe + 1), None, self.original_id(self.curr_pipe))]
+                self.emit(ROLLBACK, self.original_id(self.curr_pipe + 1), None, self.original_id(self.curr_pipe))
+                return ROLLBACK
 
     def is_doomed(self) -> bool:
         """Hook for children classes to let the engine know early that a path is doomed to fail"""
         return False
 
-    def begin_next_moves_hook(self):
-        """Hook for children classes to provide some moves instead of the brute-force solution"""
-        return []
+    def begin_next_moves_hook(self) -> bool:
+        """Hook for children classes to perform some moves instead of the brute-force solution"""
+        return False
 
     def choose_next_point(self, points: [Point]) -> Point:
         """pick a move among the possible directions"""
         return points.pop(0)
 
-    def filter_next_cells(self, points: [Point]):
-        """override to filter out some potential next cells"""
+    def filter_next_cells(self, head: Point, points: [Point]):
+        """override to filter out some potential next cells of the pipe head"""
         return points
 
 
@@ -0,0 +1,112 @@
+import argparse
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+
+from utils import setup_logging
+from pipe_engine import PipeEngine
+from shortest_path_engine import ShortestPathEngine
+from samples import Samples
+
+# Checkpoints of a running engine, so that a long resolution can be resumed exactly after a restart.
+# A checkpoint file starts with a fixed header (magic, format version, length of the engine class name),
+# followed by the engine class name and the zlib-compressed pickle of the engine : paths, curr_pipe,
+# pipes_mapping, universe, Possibles frontier and the incremental caches of the engine.
+# Checkpoints are written to a temporary file that then atomically replaces the previous checkpoint,
+# so an interrupted write never corrupts the last checkpoint.
+# The engine class name is checked before loading, so a checkpoint of one engine is not resumed as another one.
+# Note : checkpoints are pickles, so only load checkpoint files you wrote yourself.
+
+MAGIC = b"PPCK"
+VERSION = 1
+HEADER = struct.Struct("<4sBH")  # magic, version, engine class name length
+COMPRESSION_LEVEL = 1            # fastest compression, the frontier compresses well anyway
+DEFAULT_INTERVAL = 5.0           # seconds between 2 checkpoints
+
+
+def save_checkpoint(engine: PipeEngine, file_path: str):
+    class_name = type(engine).__name__.encode()
+    data = zlib.compress(pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(class_name)))
+        f.write(class_name)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def load_checkpoint(file_path: str, engine_class: type = None) -> PipeEngine:
+    """Engine restored from a checkpoint file, which must be a checkpoint of engine_class if it is given"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    magic, version, class_name_length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise Exception("Invalid checkpoint " + file_path)
+    if version != VERSION:
+        raise Exception("Unsupported checkpoint version " + str(version))
+    class_name = data[HEADER.size:HEADER.size + class_name_length].decode()
+    if engine_class is not None and class_name != engine_class.__name__:
+        raise Exception("Checkpoint {0} was written by {1}, it cannot be restored as {2}".format(
+            file_path, class_name, engine_class.__name__))
+    engine = pickle.loads(zlib.decompress(data[HEADER.size + class_name_length:]))
+    if type(engine).__name__ != class_name:
+        raise Exception("Checkpoint {0} contains a {1} instead of a {2}".format(
+            file_path, type(engine).__name__, class_name))
+    logging.info("Resuming {0} after {1} steps".format(type(engine).__name__, engine.steps))
+    return engine
+
+
+class Checkpointer:
+    """Run an engine headless and save a checkpoint periodically"""
+    def __init__(self, engine: PipeEngine, file_path: str, interval: float = DEFAULT_INTERVAL):
+        self.engine = engine
+        self.file_path = file_path
+        self.interval = interval
+        self.checkpoints = 0
+        self.checkpoint_time = 0.0  # total time spent writing checkpoints
+
+    def run(self, deadline: float = None) -> bool:
+        """Run until solved, or until the deadline (monotonic time), return True if solved"""
+        while not self.engine.over():
+            next_checkpoint = time.monotonic() + self.interval
+            self.engine.run_to_completion(next_checkpoint if deadline is None else min(next_checkpoint, deadline))
+            self.save()
+            if deadline is not None and time.monotonic() > deadline:
+                break
+        return self.engine.solved
+
+    def save(self):
+        start = time.monotonic()
+        save_checkpoint(self.engine, self.file_path)
+        self.checkpoints += 1
+        self.checkpoint_time += time.monotonic() - start
+        logging.debug("Checkpoint {0} saved after {1} steps".format(self.checkpoints, self.engine.steps))
+
+
+def resume_or_create(file_path: str, engine_factory, grid_size: int, pipe_ends: list) -> PipeEngine:
+    """Engine restored from the checkpoint file if it exists, else a new engine.
+    If engine_factory is an engine class, the checkpoint must be a checkpoint of this class"""
+    if os.path.exists(file_path):
+        return load_checkpoint(file_path, engine_factory if isinstance(engine_factory, type) else None)
+    return engine_factory(grid_size, pipe_ends)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a sample puzzle with checkpoints, resuming if possible")
+    parser.add_argument("sample")
+    parser.add_argument("checkpoint_file")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    (size, pipes) = Samples.get_puzzle(args.sample)
+    engine = resume_or_create(args.checkpoint_file, ShortestPathEngine, size, pipes)
+    checkpointer = Checkpointer(engine, args.checkpoint_file, args.interval)
+    checkpointer.run()
+    logging.info("{0} checkpoints written in {1:.3f}s".format(checkpointer.checkpoints, checkpointer.checkpoint_time))
+    logging.info(engine.display())
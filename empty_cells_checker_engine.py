@@ -1,5 +1,7 @@
 from wall_follower_engine import WallFollowerEngine
 from point import Point
+from patterns import EMPTY, WALL, DOT, OTHER, OWN, TARGET, DEAD_CELL_PATTERNS, FORCED_CELL_PATTERNS, LOOP_PATTERNS
+from articulation_points import ArticulationPoints, adjacent_cells
 
 # Strategy bringing few improvements to the wall follower strategy :
 #  - among the possible directions, pick first the closest one to the goal
@@ -7,11 +9,41 @@ from point import Point
 #  - if the target is reachable discard other moves
 #  - after a move, give up early if some empty cells are surrounded by 3 walls
 #    or if a group of empty cells is surrounded with walls
+#    (this check is incremental, only the cells around the last changes are examined)
+#  - if an empty cell next to the pipe head would become surrounded by 3 walls when the pipe goes elsewhere,
+#    the pipe must go through it
+#  - give up if several remaining pipes must go through the same articulation point of the empty cells
+#    (a single empty cell splitting a zone in parts, that only one pipe can cross)
+#    Only cuts of one cell are detected, wider narrow passages are not. The articulation points are only searched
+#    again when the zone structure may have changed around a filled or freed cell (its empty neighbours are not
+#    connected around it, or a freed cell has a single empty neighbour), so a cut appearing away from the changed
+#    cells, like a 2 cells wide passage narrowed to 1 cell, is only detected once a later move changes the zone.
+# Loops, dead cells and forced cells are detected with the lookup tables of patterns.py
+
+# reasons of the discarded states
+DEAD_CELL = "dead cell"
+HOLE = "hole"
+CROWDED_CUT = "crowded cut"
 
 
 class EmptyCellsCheckerEngine(WallFollowerEngine):
+    # pattern tables, children classes can use tables with more rules
+    dead_cell_patterns = DEAD_CELL_PATTERNS
+    forced_cell_patterns = FORCED_CELL_PATTERNS
+    loop_patterns = LOOP_PATTERNS
+    # children classes can disable the articulation points check
+    check_articulation_points = True
+
     def __init__(self, grid_size: int, pipe_ends: list):
         super().__init__(grid_size, pipe_ends)
+        # state of the holes detection, kept between moves and updated incrementally
+        self.cell_kinds = dict()        # kind of each cell in the last checked state
+        self.dead_cells = set()         # empty cells surrounded by 3 walls in the last checked state
+        self.unchecked_cells = set()    # cells changed since the last checked state without holes
+        self.uncut_cells = set()        # cells filled or freed since the last articulation points check
+        self.cut_check_all = True       # the articulation points must be checked whatever the changed cells
+        self.checked_pipes = None       # completed pipes and current pipe in the last checked state
+        self.checked_path = []          # path of the current pipe in the last checked state
 
     def choose_next_point(self, points: [Point]) -> Point:
         # pick first the next direction that is closest from the target
@@ -19,7 +51,7 @@ class EmptyCellsCheckerEngine(WallFollowerEngine):
         distances = [self.shortest_path(p, target, self.pipes_mapping[self.curr_pipe]) for p in points]
         return points.pop(distances.index(min(distances)))
 
-    def filter_next_cells(self, points: [Point]):
+    def filter_next_cells(self, head: Point, points: [Point]):
         original_pipe_id = self.original_id(self.curr_pipe)
         target = self.pipe_ends[original_pipe_id][1]
         # if the target is reachable, discard the other choices
@@ -30,54 +62,186 @@ class EmptyCellsCheckerEngine(WallFollowerEngine):
         # if a pipe creates a loop, it is not optimal
         # so only accept points that have a single adjacent with the current pipe (the point they come from)
         # or two if we are adjacent to the target
+        symbol = str(original_pipe_id)
         res = []
         for p in points:
-            pipes_adj = [p_adj for p_adj in p.adjacent_points()
-                         if self.universe[p_adj.x, p_adj.y] == str(original_pipe_id)]
-            if len(pipes_adj) == 1 or (len(pipes_adj) == 2 and target in pipes_adj):
+            kinds = [OTHER] + [TARGET if p_adj == target else OWN if self.universe[p_adj.x, p_adj.y] == symbol
+                               else OTHER for p_adj in p.adjacent_points()]
+            if not self.loop_patterns.match(kinds):
                 res.append(p)
+
+        # if leaving a next cell would make it a dead end, the pipe must go through it
+        # (the head is given by the caller, the brute-force engine filters before adding it to the path)
+        forced = [p for p in points if self.forced_cell_patterns.match(
+            [EMPTY] + [self.head_kind(p_adj, head, target, symbol) for p_adj in p.adjacent_points()])]
+        if len(forced) == 1:
+            return [p for p in res if p == forced[0]]
+        if len(forced) > 1:
+            # all moves leave a dead end
+            return []
         return res
 
+    def head_kind(self, p: Point, head: Point, target: Point, symbol: str) -> int:
+        """Kind of a cell around the head of the current pipe"""
+        value = self.universe[p.x, p.y]
+        if value == '.':
+            return EMPTY
+        if value == '#' or (value == symbol and p != head and p != target):
+            return WALL
+        if value != symbol and self.position(int(value)) < self.curr_pipe:
+            return WALL
+        return DOT
+
     def is_doomed(self):
         if super().is_doomed():
             return True
 
+        # only the cells around the cells changed since the last check need to be examined again
+        changed = self.update_cell_kinds()
+        self.unchecked_cells |= changed
+
         # if an empty cell is surrounded by 3 walls, it becomes unreachable so give up
-        also_walls = [(p.x, p.y) for (p, _dirs) in self.paths[self.curr_pipe][:-1]]
-        for (i, j) in self.universe.keys():
-            if self.universe[(i, j)] == '.':
-                if len([p for p in Point(i, j).adjacent_points() if self.is_wall(p) or (p.x, p.y) in also_walls]) == 3:
-                    return True
+        for (i, j) in changed:
+            for cell in [(i, j), (i - 1, j), (i, j + 1), (i + 1, j), (i, j - 1)]:
+                if cell in self.cell_kinds:
+                    self.update_dead_cell(cell)
+        if len(self.dead_cells) > 0:
+            return self.prune(DEAD_CELL)
 
         # if some empty cells are circled by walls, give up
-        valid = []
-        for (i, j) in self.universe.keys():
-            if self.universe[(i, j)] == '.' and (i, j) not in valid:
-                blanks, dots = self.scan_zone(i, j)
-                if len(dots) < 2:
-                    return True
-                valid += blanks
+        # the regions that do not touch a changed cell are the same as in the last state without holes,
+        # so only the regions around the changed cells are scanned
+        valid = set()
+        for (i, j) in self.unchecked_cells:
+            for cell in [(i, j), (i - 1, j), (i, j + 1), (i + 1, j), (i, j - 1)]:
+                if self.cell_kinds.get(cell) == EMPTY and cell not in valid:
+                    blanks, dots = self.scan_zone(cell[0], cell[1])
+                    if len(dots) < 2:
+                        return self.prune(HOLE)
+                    valid |= blanks
+        self.unchecked_cells.clear()
+
+        # if 2 pipes must go through the same articulation point, one of them cannot be connected
+        if self.check_articulation_points and self.zones_may_split():
+            self.uncut_cells.clear()
+            self.cut_check_all = False
+            if self.has_crowded_cut():
+                return self.prune(CROWDED_CUT)
+        return False
+
+    def zones_may_split(self) -> bool:
+        """True if the cells filled or freed since the last articulation points check may have changed the cuts :
+        a changed cell separates its empty neighbours around it (it splits or joins parts of a zone),
+        or a freed cell has a single empty neighbour (which becomes a cut)"""
+        if self.cut_check_all:
+            return True
+        for (i, j) in self.uncut_cells:
+            # the cells around the changed cell in circular order : the adjacent empty cells are only connected
+            # around it if they are in the same run of consecutive empty cells
+            ring = [(i - 1, j), (i - 1, j + 1), (i, j + 1), (i + 1, j + 1),
+                    (i + 1, j), (i + 1, j - 1), (i, j - 1), (i - 1, j - 1)]
+            empty = [self.cell_kinds.get(cell) == EMPTY for cell in ring]
+            if all(empty):
+                continue
+            run_starts = set()
+            for k in range(0, 8, 2):
+                if empty[k]:
+                    start = k
+                    while empty[(start - 1) % 8]:
+                        start = (start - 1) % 8
+                    run_starts.add(start)
+            if len(run_starts) > 1:
+                return True
+            if self.cell_kinds.get((i, j)) == EMPTY and len([k for k in range(0, 8, 2) if empty[k]]) == 1:
+                return True
         return False
 
+    def has_crowded_cut(self) -> bool:
+        """True if an articulation point of the empty cells must be crossed by several remaining pipes"""
+        empty_cells = {cell for (cell, kind) in self.cell_kinds.items() if kind == EMPTY}
+        articulation_points = ArticulationPoints(empty_cells)
+        points = articulation_points.points()
+        if len(points) == 0:
+            return False
+        crossing = {point: 0 for point in points}
+        for pipe_id in range(self.curr_pipe, len(self.pipe_ends)):
+            start = self.paths[self.curr_pipe][-1][0] if pipe_id == self.curr_pipe \
+                else self.pipe_ends[self.original_id(pipe_id)][0]
+            end = self.pipe_ends[self.original_id(pipe_id)][1]
+            if start == end or end in start.adjacent_points():
+                # connected without any empty cell
+                continue
+            start_cells = [cell for cell in adjacent_cells((start.x, start.y)) if cell in empty_cells]
+            end_cells = [cell for cell in adjacent_cells((end.x, end.y)) if cell in empty_cells]
+            for point in points:
+                if articulation_points.must_cross(point, start_cells, end_cells):
+                    crossing[point] += 1
+                    if crossing[point] > 1:
+                        return True
+        return False
+
+    def update_cell_kinds(self) -> set:
+        """Update the kind of the cells that changed since the last check, and return those cells"""
+        pipes = tuple(self.pipes_mapping[:self.curr_pipe + 1])
+        path = [(p.x, p.y) for (p, _dirs) in self.paths[self.curr_pipe]]
+        body = set(path[:-1])
+
+        if pipes != self.checked_pipes:
+            # a pipe was completed or rolled back, recompute all cells
+            self.checked_pipes = pipes
+            self.checked_path = path
+            self.dead_cells.clear()
+            self.cut_check_all = True
+            for cell in self.universe.keys():
+                self.cell_kinds[cell] = self.cell_kind(cell, body)
+            return set(self.universe.keys())
+
+        # same pipes, only the end of the current pipe path changed
+        keep = 0
+        while keep < len(path) and keep < len(self.checked_path) and path[keep] == self.checked_path[keep]:
+            keep += 1
+        # the last common cell may have changed from the pipe head to the pipe body
+        changed = set(path[max(keep - 1, 0):]) | set(self.checked_path[max(keep - 1, 0):])
+        for cell in changed:
+            kind = self.cell_kind(cell, body)
+            if (kind == EMPTY) != (self.cell_kinds[cell] == EMPTY):
+                self.uncut_cells.add(cell)
+            self.cell_kinds[cell] = kind
+        self.checked_path = path
+        return changed
+
+    def cell_kind(self, cell: tuple, body: set) -> int:
+        symbol = self.universe[cell]
+        if symbol == '#':
+            return WALL
+        if symbol == '.':
+            return EMPTY
+        position = self.position(int(symbol))
+        # completed pipes and the current pipe (except its head) count as walls
+        if position < self.curr_pipe or (position == self.curr_pipe and cell in body):
+            return WALL
+        return DOT
+
+    def update_dead_cell(self, cell: tuple):
+        (i, j) = cell
+        kinds = [self.cell_kinds.get(c, EMPTY) for c in [cell, (i - 1, j), (i, j + 1), (i + 1, j), (i, j - 1)]]
+        if self.dead_cell_patterns.match(kinds):
+            self.dead_cells.add(cell)
+        else:
+            self.dead_cells.discard(cell)
+
     def scan_zone(self, i, j):
-        blanks = []
-        dots = []
-        checked = []
+        """Flood fill the zone of empty cells containing (i, j), and stop as soon as 2 dots are found"""
+        blanks = {(i, j)}
+        dots = set()
         to_check = [(i, j)]
-        also_walls = [(p.x, p.y) for (p, _dirs) in self.paths[self.curr_pipe][:-1]]
-        while len(to_check) > 0:
-            (i, j) = to_check.pop(0)
-            p = Point(i, j)
-            checked.append((i, j))
-            symbol = self.universe[(i, j)]
-            if symbol == '.':
-                blanks.append((i, j))
-                for p2 in p.adjacent_points():
-                    not_checked = (p2.x, p2.y) not in checked
-                    not_to_check = (p2.x, p2.y) not in to_check
-                    if not_checked and not_to_check and not self.is_wall(p2) and not (p2.x, p2.y) in also_walls:
-                        to_check.append((p2.x, p2.y))
-            else:
-                dots.append((i, j))
-                continue
+        while len(to_check) > 0 and len(dots) < 2:
+            (i, j) = to_check.pop()
+            for cell in [(i - 1, j), (i, j + 1), (i + 1, j), (i, j - 1)]:
+                kind = self.cell_kinds.get(cell)
+                if kind == EMPTY and cell not in blanks:
+                    blanks.add(cell)
+                    to_check.append(cell)
+                elif kind == DOT:
+                    dots.add(cell)
         return blanks, dots
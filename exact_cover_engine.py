@@ -0,0 +1,192 @@
+import logging
+
+from utils import setup_logging
+from pipe_engine import PipeEngine
+from shortest_path_engine import ShortestPathEngine
+from point import Point
+from samples import Samples
+
+# Engine solving the puzzle as an exact cover problem, for small and medium grids.
+# Like the empty-cells-checker engine, it assumes that the solution leaves no hole in the grid,
+# so a solution is a choice of exactly one path per pipe such that every cell is covered exactly once.
+# The candidate paths of each pipe are enumerated as bitmasks of cells (discarding the paths forming a loop),
+# then Knuth's Algorithm X picks one path per pipe so that all cells are covered.
+# Paths are enumerated by increasing length bound, and the number of paths per pipe is capped,
+# so the memory stays bounded on bigger grids.
+# When no solution is found and some paths were left out by the cap, the search is incomplete, so the puzzle
+# is solved by the shortest-path engine instead of being reported without solution.
+
+DEFAULT_MAX_PATHS = 5000
+
+
+class ExactCoverEngine(PipeEngine):
+    def __init__(self, grid_size: int, pipe_ends: list, max_paths: int = DEFAULT_MAX_PATHS):
+        super().__init__(grid_size, pipe_ends)
+        self.max_paths = max_paths  # maximum number of candidate paths per pipe
+        self.solution = None        # points of the path chosen for each pipe
+        self.searched = False
+
+    def step(self) -> bool:
+        if not self.searched:
+            self.searched = True
+            self.solution = self.search()
+        if self.solution is None:
+            # The maze has no solution
+            return False
+
+        # replay the solution one pipe at a time
+        self.replay_path(len(self.paths), self.solution[len(self.paths)])
+        if len(self.paths) == len(self.pipe_ends):
+            logging.info("Pipe puzzle solved")
+            self.solved = True
+        return True
+
+    def search(self):
+        cells_number = self.grid_size * self.grid_size
+        # the longest possible path leaves 2 cells for each other pipe
+        max_length = cells_number - 2 * (len(self.pipe_ends) - 1)
+        length = self.grid_size
+        while True:
+            length = min(length, max_length)
+            logging.debug("Enumerating the paths of up to {0} cells".format(length))
+            candidates = []
+            capped = False
+            for pipe_id in range(len(self.pipe_ends)):
+                paths = []
+                for path in self.enumerate_paths(pipe_id, length):
+                    if len(paths) == self.max_paths:
+                        capped = True
+                        break
+                    paths.append(path)
+                candidates.append(paths)
+
+            solution = self.exact_cover(candidates)
+            if solution is not None:
+                return solution
+            if length == max_length:
+                if capped:
+                    logging.info("No solution found within the cap of {0} paths per pipe, "
+                                 "searching with the shortest-path engine".format(self.max_paths))
+                    return self.fallback_search()
+                return None
+            length += self.grid_size
+
+    def fallback_search(self):
+        """Points of each pipe in the solution found by the shortest-path engine, None if there is no solution"""
+        engine = ShortestPathEngine(self.grid_size, self.pipe_ends)
+        if not engine.run_to_completion():
+            return None
+        return [[point for (point, _moves) in path] for path in engine.final_paths()]
+
+    def bit(self, point: Point) -> int:
+        return 1 << (point.x * self.grid_size + point.y)
+
+    def enumerate_paths(self, pipe_id: int, max_length: int):
+        """Lazily yield the paths of up to max_length cells of a pipe, as (cells mask, points)"""
+        start, end = self.pipe_ends[pipe_id]
+        end_bit = self.bit(end)
+        symbol = str(pipe_id)
+        path = [start]
+
+        def extend(head: Point, head_bit: int, mask: int):
+            adj_points = [p for p in head.adjacent_points() if self.universe[p.x, p.y] in ('.', symbol)]
+            if end in adj_points:
+                # if the end is reachable, other moves would make the pipe form a loop
+                yield mask | end_bit, path + [end]
+                return
+            if len(path) + 1 >= max_length:
+                return
+            for p in adj_points:
+                p_bit = self.bit(p)
+                if p_bit & mask:
+                    continue
+                if len(path) + 1 + abs(p.x - end.x) + abs(p.y - end.y) > max_length:
+                    continue
+                # discard the points next to the pipe other than the head (loop)
+                p_adj_mask = 0
+                for p_adj in p.adjacent_points():
+                    if self.universe[p_adj.x, p_adj.y] != '#':
+                        p_adj_mask |= self.bit(p_adj)
+                if p_adj_mask & (mask | end_bit) not in (head_bit, head_bit | end_bit):
+                    continue
+                path.append(p)
+                yield from extend(p, p_bit, mask | p_bit)
+                path.pop()
+
+        start_bit = self.bit(start)
+        yield from extend(start, start_bit, start_bit)
+
+    def exact_cover(self, candidates: list):
+        """Knuth's Algorithm X : pick one candidate path per pipe so that each cell is covered exactly once"""
+        # columns : one per pipe and one per cell, rows : (pipe_id, path index)
+        columns = {('pipe', pipe_id): set() for pipe_id in range(len(self.pipe_ends))}
+        for cell in range(self.grid_size * self.grid_size):
+            columns[cell] = set()
+        rows = dict()
+        for (pipe_id, paths) in enumerate(candidates):
+            for (index, (mask, _points)) in enumerate(paths):
+                row_columns = [('pipe', pipe_id)]
+                cell = 0
+                while mask:
+                    if mask & 1:
+                        row_columns.append(cell)
+                    mask >>= 1
+                    cell += 1
+                rows[pipe_id, index] = row_columns
+                for column in row_columns:
+                    columns[column].add((pipe_id, index))
+
+        chosen = []
+        if not self.algorithm_x(columns, rows, chosen):
+            return None
+        solution = [None] * len(self.pipe_ends)
+        for (pipe_id, index) in chosen:
+            solution[pipe_id] = candidates[pipe_id][index][1]
+        return solution
+
+    def algorithm_x(self, columns: dict, rows: dict, chosen: list) -> bool:
+        if len(columns) == 0:
+            return True
+        # pick the column with the fewest rows to cover it
+        column = min(columns, key=lambda c: len(columns[c]))
+        for row in list(columns[column]):
+            chosen.append(row)
+            removed = self.select(columns, rows, row)
+            if self.algorithm_x(columns, rows, chosen):
+                return True
+            self.deselect(columns, rows, row, removed)
+            chosen.pop()
+        return False
+
+    @staticmethod
+    def select(columns: dict, rows: dict, row) -> list:
+        removed = []
+        for column in rows[row]:
+            for other_row in columns[column]:
+                for other_column in rows[other_row]:
+                    if other_column != column:
+                        columns[other_column].remove(other_row)
+            removed.append(columns.pop(column))
+        return removed
+
+    @staticmethod
+    def deselect(columns: dict, rows: dict, row, removed: list):
+        for column in reversed(rows[row]):
+            columns[column] = removed.pop()
+            for other_row in columns[column]:
+                for other_column in rows[other_row]:
+                    if other_column != column:
+                        columns[other_column].add(other_row)
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    (size, pipes) = Samples.get_puzzle("8")
+    engine = ExactCoverEngine(size, pipes)
+    while not engine.solved:
+        next_moves = engine.next_moves()
+        if len(next_moves) == 0:
+            break
+        for next_move in next_moves:
+            logging.debug(next_move)
+    logging.info(engine.display())
@@ -0,0 +1,48 @@
+# Colors and geometry of the puzzle grid, shared by the GUI and the headless renderer.
+# Only Tk color names are used, the renderer converts them to RGB values.
+
+# grid geometry in pixels
+CELL_SIZE = 32
+DOT_SIZE = CELL_SIZE // 2
+PIPE_SIZE = CELL_SIZE // 4
+
+# colors
+WHITE = "white"
+GREEN = "lime green"
+RED = "red2"
+BLUE = "royal blue"
+YELLOW = "gold"
+PURPLE = "MediumOrchid2"
+PINK = "magenta"
+BEIGE = "thistle"
+BLACK = "black"
+LIGHT_BLUE = "sky blue"
+GREY = "grey"
+DARK_GREEN = "green4"
+LIGHT_PINK = "pink"
+ORANGE = "dark orange"
+TURQUOISE = "turquoise"
+BROWN = "brown"
+LIGHT_GREEN = "lawn green"
+BACKGROUND_BLUE = "lavender"
+DARK_PURPLE = "dark violet"
+
+PIPE_COLORS = {
+    0: RED,
+    1: BLUE,
+    2: GREEN,
+    3: YELLOW,
+    4: PURPLE,
+    5: TURQUOISE,
+    6: PINK,
+    7: ORANGE,
+    8: BROWN,
+    9: GREY,
+    10: BLACK,
+    11: DARK_GREEN,
+    12: LIGHT_GREEN,
+    13: DARK_PURPLE,
+    14: LIGHT_BLUE,
+    15: BEIGE,
+    16: LIGHT_PINK,
+}
@@ -0,0 +1,245 @@
+import logging
+import mmap
+import os
+import struct
+from bisect import bisect_right
+
+from utils import setup_logging
+from pipe_engine import Move, GROW, SHRINK, ROLLBACK
+from point import Point
+from samples import Samples
+
+# Compact binary log of the moves performed by an engine, so a resolution can be replayed without
+# running the engine again.
+#
+# The file starts with a header describing the puzzle, followed by fixed-width 4-byte records :
+#  - move records : (type, pipe id, x, y), for a ROLLBACK the previous pipe id is stored instead of x
+#  - keyframe records : a KEYFRAME record holding the number of cells of the state, followed by one CELL
+#    record (type, pipe id, x, y) per cell of every pipe path, in path order
+# Keyframes are written periodically so any move index can be reached by replaying a few moves only.
+# On close, an index of the keyframes is appended to the file, followed by a fixed-size trailer.
+
+MAGIC = b"PPML"
+INDEX_MAGIC = b"PPMI"
+VERSION = 1
+
+# Record types
+GROW_RECORD = 1
+SHRINK_RECORD = 2
+ROLLBACK_RECORD = 3
+KEYFRAME_RECORD = 4
+CELL_RECORD = 5
+
+HEADER = struct.Struct("<4sBBB")    # magic, version, grid size, pipes number
+PIPE_ENDS = struct.Struct("<BBBB")  # start x, start y, end x, end y
+RECORD = struct.Struct("<BBBB")     # record type, pipe id, x, y
+KEYFRAME = struct.Struct("<BBH")    # KEYFRAME_RECORD, unused, cells number
+INDEX_ENTRY = struct.Struct("<II")  # move index, record offset
+TRAILER = struct.Struct("<QII4s")   # index offset, keyframes number, moves number, magic
+
+MOVE_TO_RECORD = {GROW: GROW_RECORD, SHRINK: SHRINK_RECORD, ROLLBACK: ROLLBACK_RECORD}
+
+DEFAULT_KEYFRAME_INTERVAL = 1024
+
+
+def apply_move_to_state(state: list, move: Move):
+    """Apply a move to a state, which is the list of cells added to each pipe (the pipe start excluded)"""
+    if move.move_type == GROW:
+        state[move.pipe_id].append(move.point)
+    elif move.move_type == SHRINK:
+        state[move.pipe_id].pop()
+    elif move.move_type == ROLLBACK:
+        state[move.prev_pipe_id].pop()
+    else:
+        raise Exception("Invalid move type " + move.move_type)
+
+
+class MoveRecorder:
+    """Write the moves of a resolution to a binary move log"""
+    def __init__(self, file_path: str, grid_size: int, pipe_ends: list,
+                 keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        self.file = open(file_path, "wb")
+        self.keyframe_interval = keyframe_interval
+        self.state = [[] for _ in pipe_ends]
+        self.moves_count = 0
+        self.keyframes = []  # (move index, record offset)
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, grid_size, len(pipe_ends)))
+        for (start, end) in pipe_ends:
+            self.file.write(PIPE_ENDS.pack(start.x, start.y, end.x, end.y))
+        self.write_keyframe()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def record(self, move: Move):
+        if self.moves_count > 0 and self.moves_count % self.keyframe_interval == 0:
+            self.write_keyframe()
+        if move.move_type == ROLLBACK:
+            self.file.write(RECORD.pack(ROLLBACK_RECORD, move.pipe_id, move.prev_pipe_id, 0))
+        else:
+            self.file.write(RECORD.pack(MOVE_TO_RECORD[move.move_type], move.pipe_id, move.point.x, move.point.y))
+        apply_move_to_state(self.state, move)
+        self.moves_count += 1
+
+    def write_keyframe(self):
+        self.keyframes.append((self.moves_count, self.file.tell()))
+        self.file.write(KEYFRAME.pack(KEYFRAME_RECORD, 0, sum(len(cells) for cells in self.state)))
+        for (pipe_id, cells) in enumerate(self.state):
+            for cell in cells:
+                self.file.write(RECORD.pack(CELL_RECORD, pipe_id, cell.x, cell.y))
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        for (move_index, offset) in self.keyframes:
+            self.file.write(INDEX_ENTRY.pack(move_index, offset))
+        self.file.write(TRAILER.pack(index_offset, len(self.keyframes), self.moves_count, INDEX_MAGIC))
+        self.file.close()
+
+
+class MoveLog:
+    """Read-only access to a binary move log, memory-mapped so that big logs load instantly"""
+    def __init__(self, file_path: str):
+        self.file = open(file_path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.grid_size, pipes_number = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("Invalid move log " + file_path)
+        self.pipe_ends = []
+        for i in range(pipes_number):
+            x0, y0, x1, y1 = PIPE_ENDS.unpack_from(self.data, HEADER.size + i * PIPE_ENDS.size)
+            self.pipe_ends.append((Point(x0, y0), Point(x1, y1)))
+        self.records_offset = HEADER.size + pipes_number * PIPE_ENDS.size
+
+        self.keyframe_moves = []    # move index of each keyframe
+        self.keyframe_offsets = []  # record offset of each keyframe
+        if not self.load_index():
+            # the recorder was not closed properly, rebuild the index from the records
+            self.rebuild_index()
+
+    def __len__(self):
+        return self.moves_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def load_index(self) -> bool:
+        if len(self.data) < self.records_offset + TRAILER.size:
+            return False
+        index_offset, keyframes_number, self.moves_count, magic = \
+            TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+        if magic != INDEX_MAGIC:
+            return False
+        for i in range(keyframes_number):
+            move_index, offset = INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+            self.keyframe_moves.append(move_index)
+            self.keyframe_offsets.append(offset)
+        self.records_end = index_offset
+        return True
+
+    def rebuild_index(self):
+        self.moves_count = 0
+        offset = self.records_offset
+        end = len(self.data) - (len(self.data) - self.records_offset) % RECORD.size
+        while offset < end:
+            if self.data[offset] == KEYFRAME_RECORD:
+                _type, _unused, cells_number = KEYFRAME.unpack_from(self.data, offset)
+                if offset + (cells_number + 1) * RECORD.size > end:
+                    # truncated keyframe
+                    break
+                self.keyframe_moves.append(self.moves_count)
+                self.keyframe_offsets.append(offset)
+                offset += (cells_number + 1) * RECORD.size
+            else:
+                self.moves_count += 1
+                offset += RECORD.size
+        self.records_end = offset
+
+    def keyframe_before(self, move_index: int) -> int:
+        """Index of the last keyframe taken before the given move"""
+        return bisect_right(self.keyframe_moves, move_index) - 1
+
+    def read_keyframe(self, keyframe: int) -> list:
+        state = [[] for _ in self.pipe_ends]
+        offset = self.keyframe_offsets[keyframe]
+        _type, _unused, cells_number = KEYFRAME.unpack_from(self.data, offset)
+        for i in range(cells_number):
+            _type, pipe_id, x, y = RECORD.unpack_from(self.data, offset + (i + 1) * RECORD.size)
+            state[pipe_id].append(Point(x, y))
+        return state
+
+    def move_offset(self, move_index: int) -> int:
+        keyframe = self.keyframe_before(move_index)
+        offset = self.keyframe_offsets[keyframe]
+        _type, _unused, cells_number = KEYFRAME.unpack_from(self.data, offset)
+        return offset + (cells_number + 1 + move_index - self.keyframe_moves[keyframe]) * RECORD.size
+
+    def moves(self, start: int = 0, stop: int = None):
+        """Iterate over the moves in [start, stop)"""
+        stop = self.moves_count if stop is None else min(stop, self.moves_count)
+        i = start
+        while i < stop:
+            # moves between 2 keyframes are contiguous records
+            offset = self.move_offset(i)
+            keyframe = self.keyframe_before(i)
+            next_keyframe_move = self.keyframe_moves[keyframe + 1] \
+                if keyframe + 1 < len(self.keyframe_moves) else self.moves_count
+            for _ in range(min(stop, next_keyframe_move) - i):
+                yield self.decode_move(offset)
+                offset += RECORD.size
+                i += 1
+
+    def move(self, move_index: int) -> Move:
+        if not 0 <= move_index < self.moves_count:
+            raise IndexError("No move " + str(move_index) + " in the log")
+        return self.decode_move(self.move_offset(move_index))
+
+    def decode_move(self, offset: int) -> Move:
+        record_type, pipe_id, x, y = RECORD.unpack_from(self.data, offset)
+        if record_type == GROW_RECORD:
+            return Move(GROW, pipe_id, Point(x, y))
+        elif record_type == SHRINK_RECORD:
+            return Move(SHRINK, pipe_id, Point(x, y))
+        elif record_type == ROLLBACK_RECORD:
+            return Move(ROLLBACK, pipe_id, None, x)
+        else:
+            raise Exception("Invalid move record type " + str(record_type))
+
+    def state_at(self, move_index: int) -> list:
+        """Cells of each pipe after the given number of moves, rebuilt from the closest keyframe"""
+        move_index = max(0, min(move_index, self.moves_count))
+        keyframe = self.keyframe_before(move_index)
+        state = self.read_keyframe(keyframe)
+        for move in self.moves(self.keyframe_moves[keyframe], move_index):
+            apply_move_to_state(state, move)
+        return state
+
+
+if __name__ == "__main__":
+    from shortest_path_engine import ShortestPathEngine
+
+    setup_logging(logging.INFO)
+    (size, pipes) = Samples.get_puzzle("9")
+    engine = ShortestPathEngine(size, pipes)
+    with MoveRecorder("sample.pplog", size, pipes, keyframe_interval=16) as recorder:
+        while not engine.solved:
+            for next_move in engine.next_moves():
+                recorder.record(next_move)
+    with MoveLog("sample.pplog") as move_log:
+        logging.info("{0} moves, {1} keyframes, {2} bytes".format(
+            len(move_log), len(move_log.keyframe_moves), os.path.getsize("sample.pplog")))
+        logging.info("Final state : {0}".format(move_log.state_at(len(move_log))))
+    os.remove("sample.pplog")
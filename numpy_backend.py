@@ -0,0 +1,188 @@
+import logging
+
+from utils import setup_logging
+from shortest_path_engine import ShortestPathEngine, STATIC_ORDERING
+from point import Point
+from samples import Samples
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Optional NumPy backend for the shortest-path engine.
+# The grid is mirrored in an int16 array (-1 for walls, 0 for empty cells, pipe id + 1 for pipes),
+# and all the next cells of an explored path are evaluated in one batch instead of one at a time :
+#  - a single BFS wavefront from the pipe target gives the distance estimation of every next cell
+#  - the state reached with each next cell is checked for holes (empty cells surrounded by 3 walls,
+#    empty zones reaching less than 2 pipe ends) and for unreachable pipe ends with a vectorised labelling
+#    of the empty zones of all next cells at once.
+# A next cell failing these checks would be discarded by is_doomed() when explored, so it is not even
+# added to the possibles : the solution found is the same, in fewer steps.
+# Without NumPy, the engine falls back to the pure Python shortest-path engine.
+
+BATCH_DOOMED = "batch doomed"  # reason of the next cells discarded by the batch checks
+
+# cell codes in the grid array
+WALL_CODE = -1
+EMPTY_CODE = 0
+
+# (row, column) slices of the inner grid and of its 4 neighbours in the padded grid array
+INNER = (slice(1, -1), slice(1, -1))
+NEIGHBOURS = [(slice(0, -2), slice(1, -1)), (slice(2, None), slice(1, -1)),
+              (slice(1, -1), slice(0, -2)), (slice(1, -1), slice(2, None))]
+
+
+def cell_code(symbol: str) -> int:
+    if symbol == '#':
+        return WALL_CODE
+    if symbol == '.':
+        return EMPTY_CODE
+    return int(symbol) + 1
+
+
+class ArrayUniverse(dict):
+    """Universe dict mirrored in a numpy array, indexed by (x + 1, y + 1) to include the surrounding walls"""
+    def __init__(self, grid_size: int):
+        super().__init__()
+        self.cells = numpy.full((grid_size + 2, grid_size + 2), WALL_CODE, dtype=numpy.int16)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.cells[key[0] + 1, key[1] + 1] = cell_code(value)
+
+    def __reduce__(self):
+        # the array is rebuilt from the dict items when unpickled
+        return array_universe, (self.cells.shape[0] - 2, dict(self))
+
+
+def array_universe(grid_size: int, items: dict) -> ArrayUniverse:
+    universe = ArrayUniverse(grid_size)
+    for (key, value) in items.items():
+        universe[key] = value
+    return universe
+
+
+def neighbours_sum(masks):
+    """Number of neighbours in the masks for each inner cell, for a stack of padded boolean masks"""
+    res = numpy.zeros(masks[(Ellipsis,) + INNER].shape, dtype=numpy.int8)
+    for neighbour in NEIGHBOURS:
+        res += masks[(Ellipsis,) + neighbour]
+    return res
+
+
+def label_zones(empty):
+    """Label the connected zones of a stack of padded boolean masks (0 outside of the masks)"""
+    labels = numpy.where(empty, numpy.arange(1, empty[0].size + 1).reshape(empty[0].shape), 0)
+    while True:
+        spread = labels[(Ellipsis,) + INNER].copy()
+        for neighbour in NEIGHBOURS:
+            numpy.maximum(spread, labels[(Ellipsis,) + neighbour], out=spread)
+        spread *= empty[(Ellipsis,) + INNER]
+        if numpy.array_equal(spread, labels[(Ellipsis,) + INNER]):
+            return labels
+        labels[(Ellipsis,) + INNER] = spread
+
+
+class NumpyShortestPathEngine(ShortestPathEngine):
+    def __init__(self, grid_size: int, pipe_ends: list, ordering: str = STATIC_ORDERING, bidirectional=False,
+                 max_frontier: int = None, dedup_size: int = None, hints: dict = None):
+        if numpy is None:
+            logging.warning("NumPy is not installed, using the pure Python shortest-path engine")
+        super().__init__(grid_size, pipe_ends, ordering, bidirectional, max_frontier, dedup_size, hints)
+        self.discarded = 0  # next cells discarded by the batch checks
+
+    def init_universe(self):
+        if numpy is not None:
+            self.universe = ArrayUniverse(self.grid_size)
+        super().init_universe()
+
+    def add_possibles(self, depth: int, path: list, next_cells: list, target: Point, original_pipe_id: int):
+        if numpy is None or len(next_cells) == 0:
+            return super().add_possibles(depth, path, next_cells, target, original_pipe_id)
+        distances = self.distance_map(target)
+        doomed = self.batch_doomed(next_cells, target)
+        for (next_cell, is_doomed) in zip(next_cells, doomed):
+            if is_doomed:
+                self.discarded += 1
+                self.prune(BATCH_DOOMED)
+                continue
+            estimation = 0 if next_cell == target else int(distances[next_cell.x + 1, next_cell.y + 1])
+            self.possibles.add(self.curr_pipe, depth, estimation, list(path) + [next_cell])
+
+    def distance_map(self, target: Point):
+        """Distance of every cell to the target through the empty cells (BFS wavefront), -1 if unreachable"""
+        empty = self.universe.cells == EMPTY_CODE
+        distances = numpy.full(empty.shape, -1, dtype=numpy.int16)
+        front = numpy.zeros(empty.shape, dtype=bool)
+        front[target.x + 1, target.y + 1] = True
+        distance = 0
+        while front.any():
+            distances[front] = distance
+            reached = neighbours_sum(front) > 0
+            front = numpy.zeros(empty.shape, dtype=bool)
+            front[INNER] = reached & empty[INNER] & (distances[INNER] < 0)
+            distance += 1
+        return distances
+
+    def batch_doomed(self, next_cells: list, target: Point) -> list:
+        """For each next cell, True if the state reached by moving the head of the current pipe to it is doomed"""
+        cells = self.universe.cells
+        # position of each pipe code in the process order, the current pipe and walls are handled separately
+        positions = numpy.array([-1] + list(self.pipes_positions), dtype=numpy.int16)
+        cell_positions = positions[numpy.maximum(cells, 0)]
+        walls = (cells == WALL_CODE) | ((cells > 0) & (cell_positions < self.curr_pipe))
+        # the head of the current pipe becomes part of its body in all the next states
+        for (point, _moves) in self.paths[self.curr_pipe]:
+            walls[point.x + 1, point.y + 1] = True
+        empty = cells == EMPTY_CODE
+
+        batch = len(next_cells)
+        walls = numpy.repeat(walls[numpy.newaxis], batch, axis=0)
+        empty = numpy.repeat(empty[numpy.newaxis], batch, axis=0)
+        for (k, next_cell) in enumerate(next_cells):
+            empty[k, next_cell.x + 1, next_cell.y + 1] = False
+        dots = ~walls & ~empty & (cells != WALL_CODE)
+
+        # empty cells surrounded by 3 or 4 walls, like the dead cells of the empty-cells-checker engine
+        doomed = (empty[(Ellipsis,) + INNER] & (neighbours_sum(walls) >= 3)).any(axis=(1, 2))
+
+        # empty zones next to less than 2 dots (each dot counts once for a zone even if it touches it twice)
+        labels = label_zones(empty)
+        dots_k, dots_x, dots_y = numpy.nonzero(dots)
+        touched = numpy.stack([labels[dots_k, dots_x - 1, dots_y], labels[dots_k, dots_x + 1, dots_y],
+                               labels[dots_k, dots_x, dots_y - 1], labels[dots_k, dots_x, dots_y + 1]], axis=1)
+        for j in range(1, 4):
+            touched[:, j] *= (touched[:, :j] != touched[:, j:j + 1]).all(axis=1)
+        counts = numpy.zeros((batch, cells.size + 1), dtype=numpy.int16)
+        numpy.add.at(counts, (numpy.repeat(dots_k, 4), touched.ravel()), 1)
+        zones = numpy.zeros((batch, cells.size + 1), dtype=bool)
+        zones[numpy.repeat(numpy.arange(batch), labels[0].size), labels.reshape(batch, -1).ravel()] = True
+        zones[:, 0] = False
+        doomed |= (zones & (counts < 2)).any(axis=1)
+
+        # pipe ends that can no longer be connected : the ends are not adjacent and touch no common zone
+        ends = [(self.pipe_ends[self.original_id(i)][0], self.pipe_ends[self.original_id(i)][1])
+                for i in range(self.curr_pipe + 1, len(self.pipe_ends))]
+        for (k, next_cell) in enumerate(next_cells):
+            if doomed[k]:
+                continue
+            for (start, end) in ends + [(next_cell, target)]:
+                if start == end or end in start.adjacent_points():
+                    continue
+                start_zones = {labels[k, p.x + 1, p.y + 1] for p in start.adjacent_points()}
+                end_zones = {labels[k, p.x + 1, p.y + 1] for p in end.adjacent_points()}
+                if len((start_zones & end_zones) - {0}) == 0:
+                    doomed[k] = True
+                    break
+        return doomed.tolist()
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    (size, pipes) = Samples.get_puzzle("12")
+    engine = NumpyShortestPathEngine(size, pipes)
+    engine.run_to_completion()
+    logging.info("Solved in {0} steps, {1} next cells discarded by the batch checks".format(
+        engine.steps, engine.discarded))
+    logging.info(engine.display())
@@ -8,6 +8,8 @@ from point import Point
 # to reach its goal using the cells not used yet.
 # This allows to give up early when the goal of one of the next pipes is already no longer reachable
 
+UNREACHABLE_END = "unreachable end"
+
 
 class PathCheckerEngine(BruteForceEngine):
     def __init__(self, grid_size: int, pipe_ends: list):
@@ -24,7 +26,7 @@ class PathCheckerEngine(BruteForceEngine):
                 pipe_id, start_point, end_point))
             if not self.exist_path(start_point, end_point, self.original_id(pipe_id)):
                 # There is no existing path for this pipe so we already can give up this path
-                return True
+                return self.prune(UNREACHABLE_END)
         return False
 
     def exist_path(self, p1: Point, p2: Point, pipe_id: int) -> bool:
@@ -46,7 +48,7 @@ class PathCheckerEngine(BruteForceEngine):
 
     # override to re-order the paths
     def final_paths(self):
-        return [self.paths[self.pipes_mapping.index(i)] for i in range(len(self.paths))]
+        return [self.paths[self.position(i)] for i in range(len(self.paths))]
 
 
 if __name__ == "__main__":
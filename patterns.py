@@ -0,0 +1,74 @@
+# Lookup tables of local patterns around a cell, to detect doomed or forced configurations with a single lookup.
+# A window is a fixed list of cells around a center cell, each cell has a kind coded on 2 bits,
+# so a window is coded as an integer (the kind of its first cell in the lowest bits).
+# A table evaluates a list of rules on every possible window once when it is built,
+# so the engines only compute the code of a window and read the verdict in the table.
+# New rules can be added by building a table with more rules, a rule being a function of the window kinds.
+
+# cell kinds
+EMPTY = 0  # empty cell
+WALL = 1   # grid border, completed pipe or body of the current pipe
+DOT = 2    # end of a remaining pipe, or head of the current pipe
+
+# cell kinds around a next cell of the current pipe
+OTHER = 0   # empty cell, wall or other pipe
+OWN = 1     # cell of the current pipe, except its target
+TARGET = 2  # target of the current pipe
+
+# windows : offsets of the cells from the center cell
+CROSS = [(0, 0), (-1, 0), (0, 1), (1, 0), (0, -1)]  # center and its 4 adjacent cells (same order as Point)
+SQUARE = [(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)]  # 3x3 square around the center
+
+
+def window_code(kinds) -> int:
+    code = 0
+    for (i, kind) in enumerate(kinds):
+        code |= kind << (2 * i)
+    return code
+
+
+def window_kinds(code: int, size: int) -> tuple:
+    return tuple((code >> (2 * i)) & 3 for i in range(size))
+
+
+class PatternTable:
+    """Verdict of a list of rules for every window code, the verdict is True if any rule matches"""
+    def __init__(self, window: list, rules: list):
+        self.window = window
+        self.rules = rules
+        # 4^5 entries for a cross, 4^9 for a square (built in about a second)
+        self.table = bytearray(any(rule(window_kinds(code, len(window))) for rule in rules)
+                               for code in range(4 ** len(window)))
+
+    def match(self, kinds) -> bool:
+        return self.table[window_code(kinds)] == 1
+
+    def with_rules(self, rules: list):
+        """New table with additional rules"""
+        return PatternTable(self.window, self.rules + rules)
+
+
+# Rules on the kinds of a cross window (center, then its 4 adjacent cells)
+
+def dead_end(kinds: tuple) -> bool:
+    """Empty cell surrounded by at least 3 walls : no pipe can go through it"""
+    return kinds[0] == EMPTY and kinds[1:].count(WALL) >= 3
+
+
+def dead_end_next_to_head(kinds: tuple) -> bool:
+    """Empty cell next to the head of the current pipe with 2 walls among its other adjacent cells :
+    it becomes a dead end if the pipe goes anywhere else, so the pipe must go through it"""
+    return kinds[0] == EMPTY and kinds[1:].count(WALL) >= 2
+
+
+def pipe_touches_itself(kinds: tuple) -> bool:
+    """Next cell of the current pipe adjacent to the pipe in another cell than the one it comes from,
+    except the target : the pipe would form a loop, which is never optimal"""
+    own = kinds[1:].count(OWN)
+    targets = kinds[1:].count(TARGET)
+    return not (own + targets == 1 or (own + targets == 2 and targets == 1))
+
+
+DEAD_CELL_PATTERNS = PatternTable(CROSS, [dead_end])
+FORCED_CELL_PATTERNS = PatternTable(CROSS, [dead_end_next_to_head])
+LOOP_PATTERNS = PatternTable(CROSS, [pipe_touches_itself])
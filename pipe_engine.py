@@ -1,3 +1,4 @@
+import time
 from abc import abstractmethod
 from typing import Optional
 
@@ -28,16 +29,44 @@ class PipeEngine:
         self.universe = dict()
         self.paths = []
         self.solved = False
+        self.exhausted = False  # all possible paths were explored without finding a solution
+        # the search gave up before exploring all the possible paths (heuristic engines),
+        # so not finding a solution does not mean that the maze has none
+        self.incomplete = False
+        self.steps = 0
+        # Move objects are only built when someone observes the moves (next_moves() and iter_moves())
+        # in a headless resolution (run_to_completion()) the engine only updates its state
+        self.observed = True
+        self.moves = []  # moves performed during the current step
+        # number of solutions to find before stopping, None to enumerate all the solutions
+        # a solution covers the whole grid, and none of its pipes touches itself
+        self.max_solutions = 1
+        self.solutions = []  # cells of each pipe for every solution found
+        self.curr_pipe = 0
+        # statistics : states discarded by each check (by reason), pipes rolled back
+        self.prunes = dict()
+        self.rollbacks = 0
         self.init_universe()
         # some algos do not process the pipes in the order they were provided
         # so we use a mapping array :
         #  - the index is the pipe process order
         #  - the value at the index is the original pipe_id in pipe_ends for this pipe
         self.pipes_mapping = [i for i in range(len(self.pipe_ends))]
+        # reverse mapping : process order of each original pipe_id
+        self.pipes_positions = [i for i in range(len(self.pipe_ends))]
 
     def original_id(self, pipe_id: int) -> int:
         return self.pipes_mapping[pipe_id]
 
+    def position(self, original_pipe_id: int) -> int:
+        return self.pipes_positions[original_pipe_id]
+
+    def swap_pipes(self, pipe_id1: int, pipe_id2: int):
+        """swap the process order of 2 pipes"""
+        original_id1, original_id2 = self.pipes_mapping[pipe_id1], self.pipes_mapping[pipe_id2]
+        self.pipes_mapping[pipe_id1], self.pipes_mapping[pipe_id2] = original_id2, original_id1
+        self.pipes_positions[original_id1], self.pipes_positions[original_id2] = pipe_id2, pipe_id1
+
     def init_universe(self):
         # create the grid surrounded by walls
         for i in range(-1, self.grid_size + 1):
@@ -49,6 +78,22 @@ class PipeEngine:
             self.universe[point[0].x, point[0].y] = str(i)
             self.universe[point[1].x, point[1].y] = str(i)
 
+    def prune(self, reason: str) -> bool:
+        """Count a state discarded by a check, return True so that the check can return it as its verdict"""
+        self.prunes[reason] = self.prunes.get(reason, 0) + 1
+        return True
+
+    def frontier_size(self) -> int:
+        """Number of paths waiting to be explored, for the engines keeping them"""
+        return 0
+
+    def replay_path(self, pipe_id: int, path: list):
+        """add the complete path of a pipe found beforehand, for the engines searching the whole solution at once"""
+        self.paths.append([(point, []) for point in path])
+        for point in path[1:]:
+            self.universe[point.x, point.y] = str(pipe_id)
+            self.emit(GROW, pipe_id, point)
+
     def possible_dirs(self, point: Point, pipe_id: int) -> list:
         return [adj for adj in point.adjacent_points()
                 if self.universe[adj.x, adj.y] == '.' or adj == self.pipe_ends[pipe_id][1]]
@@ -65,6 +110,74 @@ class PipeEngine:
         """must be overridden in children class if the pipes have a different order in paths and pipe_ends"""
         return self.paths
 
-    @abstractmethod
+    def enumerating(self) -> bool:
+        """True if the search goes on after the first solution"""
+        return self.max_solutions != 1
+
+    def add_solution(self) -> bool:
+        """record the current state as a solution, return True if the search is over"""
+        solution = [[point for (point, _moves) in path] for path in self.final_paths()]
+        if self.enumerating() and not self.is_valid_solution(solution):
+            # some engines do not prune the holes and the loops, they must not be counted as different solutions
+            return False
+        self.solutions.append(solution)
+        if self.max_solutions is not None and len(self.solutions) >= self.max_solutions:
+            self.solved = True
+        return self.solved
+
+    def is_valid_solution(self, solution: list) -> bool:
+        """True if the pipes cover the whole grid and none of them touches itself"""
+        if '.' in self.universe.values():
+            return False
+        for path in solution:
+            index = {point: i for (i, point) in enumerate(path)}
+            for (i, point) in enumerate(path):
+                if any(abs(index.get(adj, i) - i) > 1 for adj in point.adjacent_points()):
+                    return False
+        return True
+
+    def emit(self, move_type: str, pipe_id: int, point: Optional[Point], prev_pipe_id=None):
+        """report a move performed by the engine during the current step"""
+        if self.observed:
+            self.moves.append(Move(move_type, pipe_id, point, prev_pipe_id))
+
     def next_moves(self) -> [Move]:
+        """perform one step and return its moves, an empty list means that the maze has no solution
+        (or that the search gave up if the engine is incomplete)"""
+        self.observed = True
+        self.moves = []
+        if not self.step() and not self.incomplete:
+            self.exhausted = True
+        self.steps += 1
+        return self.moves
+
+    def iter_moves(self):
+        """generator over all the moves until the maze is solved"""
+        while not self.solved:
+            moves = self.next_moves()
+            if len(moves) == 0:
+                return
+            yield from moves
+
+    def over(self) -> bool:
+        """True when the search is over : solved, exhausted or given up"""
+        return self.solved or self.exhausted or self.incomplete
+
+    def run_to_completion(self, deadline: float = None) -> bool:
+        """headless resolution without building the moves, until solved or until the deadline (monotonic time)"""
+        self.observed = False
+        try:
+            while not self.over():
+                if not self.step() and not self.incomplete:
+                    self.exhausted = True
+                self.steps += 1
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+        finally:
+            self.observed = True
+        return self.solved
+
+    @abstractmethod
+    def step(self) -> bool:
+        """perform the next moves, return False if there is no possible move left (no solution)"""
         pass
@@ -1,62 +1,29 @@
-from tkinter import Tk, Label, Frame, Button, Checkbutton, Radiobutton, Entry, Canvas, StringVar, IntVar, ttk
-from tkinter.constants import GROOVE, X, Y, LEFT, RIGHT, NW, END
+from tkinter import Tk, Label, Frame, Button, Checkbutton, Radiobutton, Entry, Canvas, Scale, StringVar, IntVar, ttk
+from tkinter.constants import GROOVE, X, Y, LEFT, RIGHT, NW, END, HORIZONTAL
 import logging
 import re
+import time
 
-from utils import setup_logging
+from utils import setup_logging, process_rss
 from pipe_engine import Move, PipeEngine, GROW, SHRINK, ROLLBACK
+from move_log import MoveRecorder, MoveLog
 from shortest_path_engine import ShortestPathEngine
 from point import Point
 from samples import Samples
+from grid_style import CELL_SIZE, DOT_SIZE, PIPE_SIZE, WHITE, RED, BLACK, BACKGROUND_BLUE, PIPE_COLORS
 
 
 # TK config
-CELL_SIZE = 32
-DOT_SIZE = CELL_SIZE // 2
-PIPE_SIZE = CELL_SIZE // 4
 SLEEP_TIME = 1  # time in ms between 2 moves
+HEADLESS_SLICE = 0.1  # time in s the engine runs between 2 GUI refreshes in non-interactive mode
 MAX_PIPES_NUMBER = 16
-
-# colors
-WHITE = "white"
-GREEN = "lime green"
-RED = "red2"
-BLUE = "royal blue"
-YELLOW = "gold"
-PURPLE = "MediumOrchid2"
-PINK = "magenta"
-BEIGE = "thistle"
-BLACK = "black"
-LIGHT_BLUE = "sky blue"
-GREY = "grey"
-DARK_GREEN = "green4",
-LIGHT_PINK = "pink"
-ORANGE = "dark orange"
-TURQUOISE = "turquoise"
-BROWN = "brown"
-LIGHT_GREEN = "lawn green"
-BACKGROUND_BLUE = "lavender"
-DARK_PURPLE = "dark violet"
-
-PIPE_COLORS = {
-    0: RED,
-    1: BLUE,
-    2: GREEN,
-    3: YELLOW,
-    4: PURPLE,
-    5: TURQUOISE,
-    6: PINK,
-    7: ORANGE,
-    8: BROWN,
-    9: GREY,
-    10: BLACK,
-    11: DARK_GREEN,
-    12: LIGHT_GREEN,
-    13: DARK_PURPLE,
-    14: LIGHT_BLUE,
-    15: BEIGE,
-    16: LIGHT_PINK,
-}
+DEFAULT_LOG_FILE = "pipe_solver.pplog"
+REPLAY_REDRAW_THRESHOLD = 200  # above this number of moves per tick, redraw the state instead of applying moves
+STATS_REFRESH_TIME = 500  # time in ms between 2 refreshes of the stats panel
+STATS_FIELDS = ["Nodes / s", "Frontier", "Pipe", "Depth", "Prunes", "Rollbacks", "Elapsed", "Memory"]
+# the footer counter shows moves, except in the engine-only mode where the engine does not build them
+MOVES_LABEL = "Steps : "
+NODES_LABEL = "Nodes : "
 
 
 def create_circle_widget(canvas: Canvas, x: int, y: int, color: str, circle_size: int):
@@ -116,6 +83,11 @@ class Pipe:
         self.connector_widgets = []  # line between 2 consecutive pipes cells to show the link
 
     def grow(self, x: int, y: int):
+        if len(self.path) == 1 and Point(x, y) not in self.head.adjacent_points() \
+                and Point(x, y) in self.tail.adjacent_points():
+            # the engine grows this pipe from its end
+            self.head, self.tail = self.tail, self.head
+            self.path = [self.head]
         curr = self.path[-1]
         if Point(x, y) not in curr.adjacent_points():
             # sanity check, should never happen
@@ -210,6 +182,13 @@ class GridManager:
             for (point, _moves) in pipe_path[1:]:
                 self.pipes[pipe_id].grow(point.x, point.y)
 
+    def load_state(self, state: list):
+        """used in replay mode to load the cells of each pipe (excluding the pipe start) in the GUI"""
+        self.reset()
+        for (pipe_id, cells) in enumerate(state):
+            for point in cells:
+                self.pipes[pipe_id].grow(point.x, point.y)
+
 
 class App(Tk):
     def __init__(self, *args, **kwargs):
@@ -223,6 +202,16 @@ class App(Tk):
         self.steps = 0
         self.moves = []  # get the moves by batch from the engine and process them 1 by 1
         self.pipes = []  # temporary structure to create the pipes from the UI
+        self.recorder = None           # move recorder of the current run if recording is enabled
+        self.replay_log = None         # move log loaded for replay
+        self.replay_position = 0       # number of moves of the replay log currently displayed
+        self.replay_playing = False    # the replay is being played
+        self.run_start = None          # monotonic time when the current run started
+        self.run_end = None            # monotonic time when the current run finished or was stopped
+        self.stats_engine = None       # engine, steps and time at the last refresh of the stats panel
+        self.stats_steps = 0
+        self.stats_time = 0.0
+        self.solution = None           # (grid size, pipe ends, paths) of the last solution, hints for the next run
 
         self.grid_size = 7
         self.pipe_ends = []
@@ -278,11 +267,24 @@ class App(Tk):
         self.tabs_control = ttk.Notebook(self.config_panel, style='TNotebook')
         manual_tab = Frame(self.tabs_control, padx=5, pady=5)
         sample_tab = Frame(self.tabs_control, padx=5, pady=5)
+        replay_tab = Frame(self.tabs_control, padx=5, pady=5)
 
         self.tabs_control.add(manual_tab, text='Manual')
         self.tabs_control.add(sample_tab, text='Samples')
+        self.tabs_control.add(replay_tab, text='Replay')
         self.tabs_control.pack(expand=1, fill="both")
 
+        # Stats panel, refreshed at a low rate so that it does not slow down the run
+        self.stats_frame = Frame(self.config_panel, pady=5)
+        self.stats_frame.pack(fill=X)
+        self.stats_labels = dict()
+        for name in STATS_FIELDS:
+            frame = Frame(self.stats_frame)
+            frame.pack(fill=X)
+            Label(frame, text=name + " : ").pack(side=LEFT, anchor=NW)
+            self.stats_labels[name] = Label(frame, text="-", justify=LEFT)
+            self.stats_labels[name].pack(side=LEFT, anchor=NW)
+
         # Manual tab
 
         sv = StringVar()
@@ -326,6 +328,37 @@ class App(Tk):
                                        command=self.on_sample_chosen)
             sample_radio.pack(side=LEFT, padx=70)
 
+        # Replay tab
+
+        self.log_file_frame = Frame(replay_tab)
+        self.log_file_frame.pack(fill=X)
+        self.log_file_label = Label(self.log_file_frame, text="Log file : ")
+        self.log_file_label.pack(side=LEFT, anchor=NW, pady=(3, 0))
+        self.log_file_entry = Entry(self.log_file_frame, width=18)
+        self.log_file_entry.insert(0, DEFAULT_LOG_FILE)
+        self.log_file_entry.pack(side=LEFT, anchor=NW, fill=X)
+
+        # record mode (if true, the moves of each run are written to the log file)
+        self.record = IntVar()
+        self.record_checkbox = Checkbutton(replay_tab, text='Record runs', variable=self.record,
+                                           onvalue=1, offvalue=0)
+        self.record_checkbox.pack(anchor=NW, pady=5)
+
+        self.replay_buttons_frame = Frame(replay_tab)
+        self.replay_buttons_frame.pack(fill=X)
+        self.load_log_button = Button(self.replay_buttons_frame, text="Load", command=self.on_load_log_clicked)
+        self.load_log_button.pack(side=LEFT)
+        self.play_button = Button(self.replay_buttons_frame, text="Play", command=self.on_play_clicked)
+        self.play_button.pack(side=LEFT)
+        self.pause_button = Button(self.replay_buttons_frame, text="Pause", command=self.on_pause_clicked)
+        self.pause_button.pack(side=LEFT)
+
+        self.replay_scale = Scale(replay_tab, label="Move", from_=0, to=0, orient=HORIZONTAL,
+                                  command=self.on_replay_scale_moved)
+        self.replay_scale.pack(fill=X, pady=(10, 0))
+        self.replay_speed_scale = Scale(replay_tab, label="Moves per tick", from_=1, to=1000, orient=HORIZONTAL)
+        self.replay_speed_scale.pack(fill=X)
+
         # Footer
         self.footer = Frame(self, padx=5)
         self.footer.pack(fill=X)
@@ -346,9 +379,9 @@ class App(Tk):
         self.reset_button = Button(self.footer, text="Reset", command=self.reset_button_click)
         self.reset_button.pack(side=LEFT)
 
-        # steps count
+        # steps count (moves, or engine steps in the engine-only mode)
         self.steps = 0
-        self.steps_label1 = Label(self.footer, text="Steps : ")
+        self.steps_label1 = Label(self.footer, text=MOVES_LABEL)
         self.steps_label2 = Label(self.footer, text="0", width=5)
         self.steps_label2.pack(side="right")
         self.steps_label1.pack(side="right")
@@ -362,6 +395,7 @@ class App(Tk):
 
         # initialize the grid with the default size
         self.on_grid_size_changed()
+        self.refresh_stats()
 
     def on_sample_chosen(self):
         size = self.sample_radio_id.get()
@@ -508,7 +542,7 @@ class App(Tk):
             self.apply_one_move()
         else:
             self.steps_label2.config(text=str(self.steps))
-            self.finished = True
+            self.finish_run()
 
     def run_button_click(self):
         if self.running:
@@ -521,6 +555,8 @@ class App(Tk):
 
     def stop_button_click(self):
         self.stopped = True
+        if self.run_end is None:
+            self.run_end = time.monotonic()
 
     def reset_button_click(self):
         self.init_run()
@@ -528,33 +564,52 @@ class App(Tk):
     def start_run_loop(self):
         if self.finished or self.stopped:
             return
-        if not self.engine.solved:
+        if self.interactive.get() == 0 and self.recorder is None and not self.engine.solved:
+            # nobody looks at the moves, so run the engine headless by slices to keep the GUI responsive
+            self.engine.run_to_completion(time.monotonic() + HEADLESS_SLICE)
+            self.steps = self.engine.steps
+            self.steps_label1.config(text=NODES_LABEL)
+            if self.engine.exhausted or self.engine.incomplete:
+                self.report_no_solution()
+                self.finish_run()
+            else:
+                self.after(SLEEP_TIME, self.start_run_loop)
+        elif not self.engine.solved:
             self.apply_one_move()
             self.after(SLEEP_TIME, self.start_run_loop)
         else:
             if self.interactive.get() == 0:
                 self.grid_manager.load_solution(self.engine.final_paths())
             self.steps_label2.config(text=str(self.steps))
-            self.finished = True
+            self.finish_run()
 
     def apply_one_move(self):
         # get the next set of moves if no more moves in buffer
         if len(self.moves) == 0:
             self.moves += self.engine.next_moves()
         if len(self.moves) == 0:
-            # The maze has no solution
-            self.error_label["text"] += "The maze has no solution."
-            self.finished = True
+            # The maze has no solution, or the engine gave up
+            self.report_no_solution()
+            self.finish_run()
             return
 
         move = self.moves.pop(0)
         self.steps += 1
+        if self.recorder is not None:
+            self.recorder.record(move)
         if self.interactive.get() == 1:
             self.grid_manager.apply_move(move)
             if self.steps % 50 == 0:
                 # refresh the counter every 50 moves to avoid blinking on refresh
                 self.steps_label2.config(text=str(self.steps))
 
+    def report_no_solution(self):
+        if self.engine.incomplete:
+            # heuristic engines can give up on a maze that has a solution
+            self.error_label["text"] += "No solution found (incomplete search)."
+        else:
+            self.error_label["text"] += "The maze has no solution."
+
     def init_run(self):
         # ensure the specified pipes setup is valid
         if not self.ready_for_run:
@@ -566,11 +621,19 @@ class App(Tk):
             self.ready_for_run = True
         # reset pipe engine
         self.engine = self.new_pipe_engine()
+        # reset the moves recording
+        self.replay_playing = False
+        self.close_recorder()
+        if self.record.get() == 1:
+            self.recorder = MoveRecorder(self.log_file_entry.get(), self.grid_size, self.pipe_ends)
         # reset pipes
         self.grid_manager.load_maze(self.grid_size, self.pipe_ends)
         # reset steps counter
         self.steps = 0
+        self.steps_label1.config(text=MOVES_LABEL)
         self.steps_label2.config(text=str(self.steps))
+        self.run_start = time.monotonic()
+        self.run_end = None
         # reset flags
         self.step_by_step_ready = True
         self.stopped = False
@@ -579,13 +642,127 @@ class App(Tk):
         self.moves = []
         return True
 
+    def finish_run(self):
+        self.finished = True
+        if self.engine.solved:
+            paths = [[point for (point, _moves) in path] for path in self.engine.final_paths()]
+            if self.engine.is_valid_solution(paths):
+                self.solution = (self.grid_size, list(self.pipe_ends), paths)
+        if self.run_end is None:
+            self.run_end = time.monotonic()
+        self.close_recorder()
+
+    def refresh_stats(self):
+        """update the stats panel of the current engine, then schedule the next refresh"""
+        now = time.monotonic()
+        engine = self.engine
+        if engine is not self.stats_engine:
+            self.stats_engine, self.stats_steps, self.stats_time = engine, engine.steps, now
+        rate = (engine.steps - self.stats_steps) / max(now - self.stats_time, 0.001)
+        self.stats_steps, self.stats_time = engine.steps, now
+
+        # no pipe is active before the first step and after the maze is exhausted (curr_pipe is -1)
+        pipe = engine.curr_pipe
+        active = 0 <= pipe < len(engine.paths)
+        depth = len(engine.paths[pipe]) - 1 if active else 0
+        prunes = sorted(engine.prunes.items(), key=lambda item: -item[1])
+        elapsed = 0.0 if self.run_start is None else (self.run_end or now) - self.run_start
+        values = {
+            "Nodes / s": "{0:.0f}".format(rate),
+            "Frontier": str(engine.frontier_size()),
+            "Pipe": "{0} / {1}".format(pipe + 1 if active else "-", len(engine.pipe_ends)),
+            "Depth": str(depth),
+            "Prunes": "\n".join("{0} : {1}".format(reason, count) for (reason, count) in prunes) or "0",
+            "Rollbacks": str(engine.rollbacks),
+            "Elapsed": "{0:.1f}s".format(elapsed),
+            "Memory": "{0:.1f} MB".format(process_rss() / 2 ** 20),
+        }
+        for (name, value) in values.items():
+            self.stats_labels[name].config(text=value)
+        self.after(STATS_REFRESH_TIME, self.refresh_stats)
+
+    def close_recorder(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def on_load_log_clicked(self):
+        try:
+            move_log = MoveLog(self.log_file_entry.get())
+        except Exception as e:
+            self.error_label["text"] = "Cannot load the move log : " + str(e)
+            return
+        logging.info('Loading move log with ' + str(len(move_log)) + ' moves')
+        # stop the current resolution, the grid now shows the puzzle of the log
+        self.stopped = True
+        self.close_recorder()
+        if self.replay_log is not None:
+            self.replay_log.close()
+        self.replay_log = move_log
+        self.replay_playing = False
+        self.grid_size, self.pipe_ends = move_log.grid_size, move_log.pipe_ends
+        self.on_grid_size_changed()
+        self.grid_manager.load_maze(self.grid_size, self.pipe_ends)
+        self.ready_for_run = True
+        self.replay_scale.config(to=len(move_log))
+        self.replay_seek(0)
+
+    def on_play_clicked(self):
+        if self.replay_log is None or self.replay_playing:
+            return
+        self.replay_playing = True
+        self.replay_loop()
+
+    def on_pause_clicked(self):
+        self.replay_playing = False
+
+    def on_replay_scale_moved(self, value):
+        # the callback is also triggered when the replay loop moves the scale
+        if self.replay_log is not None and int(value) != self.replay_position:
+            self.replay_seek(int(value))
+
+    def replay_seek(self, position: int):
+        """display the state of the grid after the given number of moves of the replay log"""
+        self.grid_manager.load_state(self.replay_log.state_at(position))
+        self.replay_position = position
+        self.replay_scale.set(position)
+        self.steps_label1.config(text=MOVES_LABEL)
+        self.steps_label2.config(text=str(position))
+
+    def replay_loop(self):
+        if not self.replay_playing:
+            return
+        stop = min(self.replay_position + self.replay_speed_scale.get(), len(self.replay_log))
+        if stop - self.replay_position > REPLAY_REDRAW_THRESHOLD:
+            self.replay_seek(stop)
+        else:
+            for move in self.replay_log.moves(self.replay_position, stop):
+                self.grid_manager.apply_move(move)
+            self.replay_position = stop
+            self.replay_scale.set(stop)
+            self.steps_label2.config(text=str(stop))
+        if self.replay_position < len(self.replay_log):
+            self.after(SLEEP_TIME, self.replay_loop)
+        else:
+            self.replay_playing = False
+
     def new_pipe_engine(self) -> PipeEngine:
         # return PathCheckerEngine(self.grid_size, self.pipe_ends)
         # return WallFollowerEngine(self.grid_size, self.pipe_ends)
         # return EmptyCellsCheckerEngine(self.grid_size, self.pipe_ends)
-        return ShortestPathEngine(self.grid_size, self.pipe_ends)
-
-
-setup_logging(logging.INFO)
-app = App()
-app.mainloop()
+        # return PortfolioEngine(self.grid_size, self.pipe_ends)
+        return ShortestPathEngine(self.grid_size, self.pipe_ends, hints=self.solution_hints())
+
+    def solution_hints(self) -> dict:
+        """paths of the last solution for the pipes whose ends did not move since, tried first by the engine"""
+        if self.solution is None or self.solution[0] != self.grid_size:
+            return dict()
+        (_grid_size, pipe_ends, paths) = self.solution
+        return {i: paths[i] for i in range(min(len(pipe_ends), len(self.pipe_ends)))
+                if pipe_ends[i] == self.pipe_ends[i]}
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    app = App()
+    app.mainloop()
@@ -1,43 +1,67 @@
 # directions
 LEFT, UP, RIGHT, DOWN = ("left", "up", "right", "down")
 
+# index of each direction in the adjacent points
+DIRECTION_INDEX = {UP: 0, RIGHT: 1, DOWN: 2, LEFT: 3}
+
 
 class Point:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+    """Immutable cell of the grid.
+    Points are interned : Point(x, y) always returns the same object for the same coordinates,
+    so they can be compared by identity, and their hash and neighbours are computed only once."""
+    __slots__ = ("x", "y", "_hash", "_adjacent", "_diagonal")
+    _interned = dict()
+
+    def __new__(cls, x, y):
+        point = cls._interned.get((x, y))
+        if point is None:
+            point = object.__new__(cls)
+            object.__setattr__(point, "x", x)
+            object.__setattr__(point, "y", y)
+            # hash the Point object as the tuple (x, y)
+            object.__setattr__(point, "_hash", (x, y).__hash__())
+            object.__setattr__(point, "_adjacent", None)
+            object.__setattr__(point, "_diagonal", None)
+            # another thread may have interned the same cell meanwhile, setdefault is atomic so all threads
+            # get the same point
+            point = cls._interned.setdefault((x, y), point)
+        return point
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Point is immutable")
+
+    def __reduce__(self):
+        # unpickled points are interned as well
+        return Point, (self.x, self.y)
 
     def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
+        return self is other
 
     def __repr__(self):
         return "(" + str(self.x) + ", " + str(self.y) + ")"
 
     def __hash__(self):
-        # hash the Point object as the tuple (x, y)
-        return (self.x, self.y).__hash__()
+        return self._hash
 
-    def adjacent_points(self):
+    def adjacent_points(self) -> tuple:
         """All 4 adjacent points"""
-        return [self.adj(UP), self.adj(RIGHT), self.adj(DOWN), self.adj(LEFT)]
+        if self._adjacent is None:
+            object.__setattr__(self, "_adjacent", (Point(self.x - 1, self.y), Point(self.x, self.y + 1),
+                                                   Point(self.x + 1, self.y), Point(self.x, self.y - 1)))
+        return self._adjacent
 
-    def diagonal_points(self):
+    def diagonal_points(self) -> tuple:
         """All 4 diagonal points"""
-        return [self.adj(UP).adj(LEFT), self.adj(UP).adj(RIGHT),
-                self.adj(DOWN).adj(LEFT), self.adj(DOWN).adj(RIGHT)]
+        if self._diagonal is None:
+            object.__setattr__(self, "_diagonal", (Point(self.x - 1, self.y - 1), Point(self.x - 1, self.y + 1),
+                                                   Point(self.x + 1, self.y - 1), Point(self.x + 1, self.y + 1)))
+        return self._diagonal
 
     def adj(self, direction: str):
         """Adjacent point in the given direction"""
-        if direction == LEFT:
-            return Point(self.x, self.y - 1)
-        elif direction == UP:
-            return Point(self.x - 1, self.y)
-        elif direction == RIGHT:
-            return Point(self.x, self.y + 1)
-        elif direction == DOWN:
-            return Point(self.x + 1, self.y)
-        else:
+        if direction not in DIRECTION_INDEX:
             raise Exception("Invalid direction: " + direction)
+        return self.adjacent_points()[DIRECTION_INDEX[direction]]
 
     @staticmethod
     def next_dir(direction: str):
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import queue
+import time
+from functools import partial
+from multiprocessing import Process, Queue
+
+from utils import setup_logging
+from pipe_engine import PipeEngine
+from wall_follower_engine import WallFollowerEngine
+from empty_cells_checker_engine import EmptyCellsCheckerEngine
+from shortest_path_engine import ShortestPathEngine, MOST_CONSTRAINED_ORDERING
+from exact_cover_engine import ExactCoverEngine
+from puzzle_io import paths_to_json, paths_from_json
+from samples import Samples
+
+# Portfolio solver : no engine is the fastest on every puzzle, so several engines race on the same puzzle
+# in separate processes, the first solution wins and the other processes are terminated.
+# The winner of each puzzle is recorded in a JSON history file with the features of the puzzle
+# (grid size, number of pipes, pipe ends against the walls), so when there are fewer processes than engines,
+# the engines that won on the most similar puzzles are started first.
+
+DEFAULT_HISTORY_FILE = "portfolio_history.json"
+NEIGHBOURS = 5  # number of similar puzzles of the history voting for their winner
+
+# engines of the portfolio, by name
+ENGINES = {
+    "shortest-path": ShortestPathEngine,
+    "most-constrained": partial(ShortestPathEngine, ordering=MOST_CONSTRAINED_ORDERING),
+    "bidirectional": partial(ShortestPathEngine, bidirectional=True),
+    "wall-follower": WallFollowerEngine,
+    "empty-cells-checker": EmptyCellsCheckerEngine,
+    "exact-cover": ExactCoverEngine,
+}
+
+
+def puzzle_features(grid_size: int, pipe_ends: list) -> dict:
+    ends = [end for pipe in pipe_ends for end in pipe]
+    wall_ends = [end for end in ends if end.x in (0, grid_size - 1) or end.y in (0, grid_size - 1)]
+    return {
+        "size": grid_size,
+        "pipes": len(pipe_ends),
+        "wall_ends": len(wall_ends) / len(ends) if len(ends) > 0 else 0,
+    }
+
+
+def features_distance(features1: dict, features2: dict) -> float:
+    return abs(features1["size"] - features2["size"]) + abs(features1["pipes"] - features2["pipes"]) / 2 \
+        + 10 * abs(features1["wall_ends"] - features2["wall_ends"])
+
+
+class PortfolioHistory:
+    """Winning engine of the previously solved puzzles, stored in a JSON file"""
+    def __init__(self, file_path: str = DEFAULT_HISTORY_FILE):
+        self.file_path = file_path
+        self.records = []
+        if os.path.exists(file_path):
+            with open(file_path) as f:
+                self.records = json.load(f)
+
+    def record(self, grid_size: int, pipe_ends: list, winner: str, solve_time: float):
+        self.records.append({"features": puzzle_features(grid_size, pipe_ends), "winner": winner, "time": solve_time})
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.records, f, indent=1)
+        os.replace(tmp_path, self.file_path)
+
+    def rank(self, grid_size: int, pipe_ends: list, names: list) -> list:
+        """Engine names ordered by number of wins on the most similar puzzles (the given order on ties)"""
+        features = puzzle_features(grid_size, pipe_ends)
+        similar = sorted(self.records, key=lambda record: features_distance(features, record["features"]))
+        votes = {name: 0 for name in names}
+        for record in similar[:NEIGHBOURS]:
+            if record["winner"] in votes:
+                votes[record["winner"]] += 1
+        return sorted(names, key=lambda name: -votes[name])
+
+
+def run_engine(name: str, grid_size: int, pipe_ends: list, results: Queue):
+    """Solve the puzzle with one engine of the portfolio, in a separate process"""
+    start = time.monotonic()
+    paths = None
+    try:
+        engine = ENGINES[name](grid_size, pipe_ends)
+        if engine.run_to_completion():
+            paths = paths_to_json(engine.final_paths())
+    except Exception:
+        logging.exception("Engine {0} failed".format(name))
+    finally:
+        # always report, the race waits for a result of every engine
+        results.put((name, paths, time.monotonic() - start))
+
+
+def solve_portfolio(grid_size: int, pipe_ends: list, names: list = None, processes: int = None,
+                    timeout: float = None, history: PortfolioHistory = None) -> tuple:
+    """Race the engines in separate processes, return the name of the winner and the points of each pipe,
+    or (None, None) if no engine found a solution before the timeout (in seconds)"""
+    names = list(names or ENGINES)
+    if history is not None:
+        names = history.rank(grid_size, pipe_ends, names)
+    names = names[:processes or os.cpu_count()]
+    logging.debug("Portfolio engines : " + ", ".join(names))
+
+    results = Queue()
+    workers = [Process(target=run_engine, args=(name, grid_size, pipe_ends, results), daemon=True)
+               for name in names]
+    for worker in workers:
+        worker.start()
+    give_up_time = None if timeout is None else time.monotonic() + timeout
+    try:
+        for _ in workers:
+            try:
+                wait = None if give_up_time is None else max(0.0, give_up_time - time.monotonic())
+                (name, paths, solve_time) = results.get(timeout=wait)
+            except queue.Empty:
+                break
+            if paths is not None:
+                logging.info("Engine {0} solved the puzzle in {1:.3f}s".format(name, solve_time))
+                if history is not None:
+                    history.record(grid_size, pipe_ends, name, solve_time)
+                return name, paths_from_json(paths)
+        return None, None
+    finally:
+        # stop the engines still running
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
+class PortfolioEngine(PipeEngine):
+    """Engine racing the portfolio engines, then replaying the solution of the winner pipe by pipe"""
+    def __init__(self, grid_size: int, pipe_ends: list, processes: int = None,
+                 history_file: str = DEFAULT_HISTORY_FILE):
+        super().__init__(grid_size, pipe_ends)
+        self.processes = processes
+        self.history = PortfolioHistory(history_file)
+        self.winner = None
+        self.solution = None
+        self.searched = False
+
+    def step(self) -> bool:
+        if not self.searched:
+            self.searched = True
+            (self.winner, self.solution) = solve_portfolio(self.grid_size, self.pipe_ends,
+                                                           processes=self.processes, history=self.history)
+        if self.solution is None:
+            return False
+
+        # replay the solution one pipe at a time
+        self.replay_path(len(self.paths), self.solution[len(self.paths)])
+        if len(self.paths) == len(self.pipe_ends):
+            logging.info("Pipe puzzle solved")
+            self.solved = True
+        return True
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    history = PortfolioHistory()
+    for name in ["8", "10", "11", "12", "13"]:
+        (size, pipes) = Samples.get_puzzle(name)
+        (winner, _paths) = solve_portfolio(size, pipes, history=history)
+        logging.info("Sample {0} : won by {1}".format(name, winner))
@@ -0,0 +1,46 @@
+from point import Point
+
+# JSON representation of the puzzles and their solutions, used to exchange them with other programs :
+#  - a puzzle is {"size": 5, "pipes": [[[0, 4], [2, 3]], [[2, 1], [4, 3]], ...]}, like the SAMPLES entries
+#  - a solution is the list of cells of each pipe, from the pipe start to the pipe end : [[[0, 4], [1, 4], ...], ...]
+
+
+def puzzle_to_json(grid_size: int, pipe_ends: list) -> dict:
+    return {
+        "size": grid_size,
+        "pipes": [[[start.x, start.y], [end.x, end.y]] for (start, end) in pipe_ends]
+    }
+
+
+def puzzle_from_json(data: dict) -> tuple:
+    """Return the (grid_size, pipe_ends) of a JSON puzzle, raise a ValueError if it is invalid"""
+    if not isinstance(data, dict) or "size" not in data or "pipes" not in data:
+        raise ValueError("A puzzle must have a size and pipes")
+    grid_size = data["size"]
+    if not isinstance(grid_size, int) or not 0 < grid_size < 256:
+        raise ValueError("Invalid grid size " + str(grid_size))
+    pipe_ends = []
+    used = set()
+    for pipe in data["pipes"]:
+        try:
+            ((x0, y0), (x1, y1)) = pipe
+        except (TypeError, ValueError):
+            raise ValueError("Invalid pipe " + str(pipe))
+        for (x, y) in ((x0, y0), (x1, y1)):
+            if not isinstance(x, int) or not isinstance(y, int) or not 0 <= x < grid_size or not 0 <= y < grid_size:
+                raise ValueError("Invalid cell " + str([x, y]))
+            if (x, y) in used:
+                raise ValueError("Cell " + str([x, y]) + " is already used")
+            used.add((x, y))
+        pipe_ends.append((Point(x0, y0), Point(x1, y1)))
+    return grid_size, pipe_ends
+
+
+def paths_to_json(paths: list) -> list:
+    """JSON solution from the final paths of an engine"""
+    return [[[point.x, point.y] for (point, _moves) in path] for path in paths]
+
+
+def paths_from_json(data: list) -> list:
+    """Cells of each pipe of a JSON solution"""
+    return [[Point(x, y) for (x, y) in path] for path in data]
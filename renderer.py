@@ -0,0 +1,280 @@
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+from utils import setup_logging
+from grid_style import PIPE_COLORS, BACKGROUND_BLUE, BLACK, CELL_SIZE, DOT_SIZE, PIPE_SIZE
+from puzzle_io import puzzle_from_json, paths_from_json
+from shortest_path_engine import ShortestPathEngine
+from samples import Samples
+
+# Headless renderer of puzzles and solutions, to produce images without a display (thumbnails, reports...).
+# The image is drawn like the GUI grid (same colors and same geometry) straight into an RGB byte buffer,
+# that is written as a PPM or PNG file (PNG encoded with zlib only), or the puzzle is written as an SVG document.
+# For bulk rendering, the empty grid of each size and the pixel spans of the circles are computed once,
+# so each image only copies the grid buffer and fills the rows of its pipes.
+# A corpus is a JSON lines file with a puzzle per line in the puzzle_io format, with optional "name" and "paths"
+# (the solution in the puzzle_io format) entries. The names are sanitised to stay inside the output directory.
+
+MARGIN = 5             # pixels around the grid, like in the GUI canvas
+OUTER_BACKGROUND = "#eee"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESSION_LEVEL = 6
+IMAGE_FORMATS = ["png", "ppm", "svg"]
+UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+# RGB values of the Tk color names used by the GUI
+COLOR_RGB = {
+    "white": (255, 255, 255),
+    "lime green": (50, 205, 50),
+    "red2": (238, 0, 0),
+    "royal blue": (65, 105, 225),
+    "gold": (255, 215, 0),
+    "MediumOrchid2": (209, 95, 238),
+    "magenta": (255, 0, 255),
+    "thistle": (216, 191, 216),
+    "black": (0, 0, 0),
+    "sky blue": (135, 206, 235),
+    "grey": (190, 190, 190),
+    "green4": (0, 139, 0),
+    "pink": (255, 192, 203),
+    "dark orange": (255, 140, 0),
+    "turquoise": (64, 224, 208),
+    "brown": (165, 42, 42),
+    "lawn green": (124, 252, 0),
+    "lavender": (230, 230, 250),
+    "dark violet": (148, 0, 211),
+}
+
+
+def color_rgb(color: str) -> tuple:
+    """RGB value of a Tk color name or of a #rgb / #rrggbb color"""
+    if color.startswith("#"):
+        digits = color[1:]
+        if len(digits) == 3:
+            digits = "".join(2 * digit for digit in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    if color not in COLOR_RGB:
+        raise Exception("Unknown color " + color)
+    return COLOR_RGB[color]
+
+
+def pipe_color(pipe_id: int) -> str:
+    return PIPE_COLORS[pipe_id % len(PIPE_COLORS)]
+
+
+def image_size(grid_size: int) -> int:
+    return 2 * MARGIN + grid_size * CELL_SIZE + 1
+
+
+class Image:
+    """RGB image stored row by row in a bytearray (3 bytes per pixel)"""
+    def __init__(self, width: int, height: int, color: str = "white"):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(color_rgb(color)) * (width * height))
+
+    def copy(self):
+        image = Image.__new__(Image)
+        image.width = self.width
+        image.height = self.height
+        image.pixels = bytearray(self.pixels)
+        return image
+
+    def fill_rectangle(self, i0: int, j0: int, i1: int, j1: int, color: str):
+        """Fill the pixels from column i0 to i1 and from row j0 to j1 (excluded)"""
+        i0, i1 = max(i0, 0), min(i1, self.width)
+        if i1 <= i0:
+            return
+        row = bytes(color_rgb(color)) * (i1 - i0)
+        for j in range(max(j0, 0), min(j1, self.height)):
+            start = 3 * (j * self.width + i0)
+            self.pixels[start:start + len(row)] = row
+
+    def fill_spans(self, i: int, j: int, spans: list, color: str):
+        """Fill the (row offset, first column offset, last column offset excluded) spans from pixel (i, j)"""
+        rgb = bytes(color_rgb(color))
+        for (dj, di0, di1) in spans:
+            start = 3 * ((j + dj) * self.width + i + di0)
+            self.pixels[start:start + 3 * (di1 - di0)] = rgb * (di1 - di0)
+
+    def to_ppm(self) -> bytes:
+        return "P6\n{0} {1}\n255\n".format(self.width, self.height).encode() + bytes(self.pixels)
+
+    def to_png(self) -> bytes:
+        # each row starts with its filter type (0 : no filter)
+        stride = 3 * self.width
+        raw = b"".join(b"\x00" + self.pixels[j * stride:(j + 1) * stride] for j in range(self.height))
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)  # 8 bits RGB
+        return PNG_SIGNATURE + png_chunk(b"IHDR", header) \
+            + png_chunk(b"IDAT", zlib.compress(raw, PNG_COMPRESSION_LEVEL)) + png_chunk(b"IEND", b"")
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+@lru_cache(maxsize=None)
+def circle_spans(circle_size: int) -> tuple:
+    """Pixel spans of a circle centered in a cell, relative to the top left corner of the cell"""
+    # same containing square as create_circle_widget() in the GUI
+    pad = (CELL_SIZE - circle_size) / 2
+    (low, high) = (pad + 1, CELL_SIZE - pad)
+    (center, radius) = ((low + high) / 2, (high - low) / 2)
+    spans = []
+    for d in range(math.floor(low), math.ceil(high)):
+        dy = d + 0.5 - center
+        if abs(dy) >= radius:
+            continue
+        half = math.sqrt(radius * radius - dy * dy)
+        spans.append((d, round(center - half), round(center + half)))
+    return tuple(spans)
+
+
+@lru_cache(maxsize=None)
+def grid_image(grid_size: int) -> Image:
+    """Empty grid of the GUI, copied for each image of this size"""
+    size = image_size(grid_size)
+    end = MARGIN + grid_size * CELL_SIZE
+    image = Image(size, size, OUTER_BACKGROUND)
+    image.fill_rectangle(MARGIN, MARGIN, end, end, BACKGROUND_BLUE)
+    for k in range(grid_size + 1):
+        line = MARGIN + k * CELL_SIZE
+        image.fill_rectangle(line, MARGIN, line + 1, end + 1, BLACK)
+        image.fill_rectangle(MARGIN, line, end + 1, line + 1, BLACK)
+    return image
+
+
+def cell_corner(point) -> tuple:
+    # like in the GUI, x is the row of the cell and y its column
+    return MARGIN + point.y * CELL_SIZE, MARGIN + point.x * CELL_SIZE
+
+
+def connector_box(p1, p2) -> tuple:
+    """(i0, j0, i1, j1) box of the rectangle linking the centers of 2 adjacent cells, like in the GUI"""
+    (i0, j0) = cell_corner(min(p1, p2, key=lambda p: (p.x, p.y)))
+    (i1, j1) = cell_corner(max(p1, p2, key=lambda p: (p.x, p.y)))
+    (center, half) = (CELL_SIZE // 2, PIPE_SIZE // 2)
+    if p1.x == p2.x:
+        return i0 + center, j0 + center - half, i1 + center, j1 + center + half
+    return i0 + center - half, j0 + center, i1 + center + half, j1 + center
+
+
+def render_image(grid_size: int, pipe_ends: list, paths: list = None) -> Image:
+    """Image of the puzzle, with the cells of each pipe if paths are given"""
+    image = grid_image(grid_size).copy()
+    for (pipe_id, ends) in enumerate(pipe_ends):
+        color = pipe_color(pipe_id)
+        for end in ends:
+            image.fill_spans(*cell_corner(end), circle_spans(DOT_SIZE + 10), color)
+        if paths is None:
+            continue
+        path = paths[pipe_id]
+        for k in range(1, len(path)):
+            image.fill_rectangle(*connector_box(path[k - 1], path[k]), color)
+            image.fill_spans(*cell_corner(path[k]), circle_spans(DOT_SIZE), color)
+    return image
+
+
+def render_svg(grid_size: int, pipe_ends: list, paths: list = None) -> str:
+    """SVG document of the puzzle, with the same geometry as the images"""
+    def hex_color(color: str) -> str:
+        return "#{0:02x}{1:02x}{2:02x}".format(*color_rgb(color))
+
+    def circle(point, circle_size: int, color: str) -> str:
+        (i, j) = cell_corner(point)
+        return '<circle cx="{0}" cy="{1}" r="{2}" fill="{3}"/>'.format(
+            i + CELL_SIZE / 2 + 0.5, j + CELL_SIZE / 2 + 0.5, circle_size / 2 - 0.5, hex_color(color))
+
+    size = image_size(grid_size)
+    end = MARGIN + grid_size * CELL_SIZE
+    elements = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" viewBox="0 0 {0} {0}">'.format(size),
+        '<rect width="{0}" height="{0}" fill="{1}"/>'.format(size, hex_color(OUTER_BACKGROUND)),
+        '<rect x="{0}" y="{0}" width="{1}" height="{1}" fill="{2}"/>'.format(
+            MARGIN, end - MARGIN, hex_color(BACKGROUND_BLUE)),
+    ]
+    for k in range(grid_size + 1):
+        line = MARGIN + k * CELL_SIZE + 0.5
+        elements.append('<path d="M{0} {1}V{2}M{1} {0}H{2}" stroke="{3}"/>'.format(
+            line, MARGIN, end + 1, hex_color(BLACK)))
+    for (pipe_id, ends) in enumerate(pipe_ends):
+        color = pipe_color(pipe_id)
+        elements += [circle(point, DOT_SIZE + 10, color) for point in ends]
+        if paths is None:
+            continue
+        path = paths[pipe_id]
+        for k in range(1, len(path)):
+            (i0, j0, i1, j1) = connector_box(path[k - 1], path[k])
+            elements.append('<rect x="{0}" y="{1}" width="{2}" height="{3}" fill="{4}"/>'.format(
+                i0, j0, i1 - i0, j1 - j0, hex_color(color)))
+            elements.append(circle(path[k], DOT_SIZE, color))
+    elements.append("</svg>")
+    return "\n".join(elements) + "\n"
+
+
+def write_image(file_path: str, grid_size: int, pipe_ends: list, paths: list = None):
+    """Write the puzzle to a PNG, PPM or SVG file, depending on the file extension"""
+    image_format = os.path.splitext(file_path)[1][1:].lower()
+    if image_format == "svg":
+        data = render_svg(grid_size, pipe_ends, paths).encode()
+    elif image_format == "png":
+        data = render_image(grid_size, pipe_ends, paths).to_png()
+    elif image_format == "ppm":
+        data = render_image(grid_size, pipe_ends, paths).to_ppm()
+    else:
+        raise Exception("Unknown image format " + image_format)
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+
+def safe_file_name(name: str) -> str:
+    """File name made of the name of a corpus puzzle, without path separators nor leading dots"""
+    name = UNSAFE_NAME_CHARS.sub("_", name).lstrip(".")
+    return name if name != "" else "_"
+
+
+def render_corpus(corpus_path: str, output_dir: str, image_format: str = "png") -> int:
+    """Render every puzzle of a JSON lines corpus to the output directory, return the number of images"""
+    if image_format not in IMAGE_FORMATS:
+        raise Exception("Unknown image format " + image_format)
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    with open(corpus_path) as f:
+        for (line_number, line) in enumerate(f, 1):
+            if line.strip() == "":
+                continue
+            data = json.loads(line)
+            (grid_size, pipe_ends) = puzzle_from_json(data)
+            paths = paths_from_json(data["paths"]) if "paths" in data else None
+            name = safe_file_name(str(data.get("name", line_number)))
+            write_image(os.path.join(output_dir, name + "." + image_format), grid_size, pipe_ends, paths)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the puzzles of a corpus, or the solved samples")
+    parser.add_argument("output_dir")
+    parser.add_argument("--corpus", help="JSON lines file of puzzles, with their solution in a 'paths' entry")
+    parser.add_argument("--format", choices=IMAGE_FORMATS, default="png")
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    if args.corpus is not None:
+        logging.info("{0} images rendered".format(render_corpus(args.corpus, args.output_dir, args.format)))
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name in ["4", "5", "6", "7", "8", "9", "10", "11", "12"]:
+            (size, pipes) = Samples.get_puzzle(name)
+            engine = ShortestPathEngine(size, pipes)
+            engine.run_to_completion()
+            solution = [[point for (point, _moves) in path] for path in engine.final_paths()]
+            write_image(os.path.join(args.output_dir, name + "." + args.format), size, pipes, solution)
+        logging.info("Solved samples rendered in " + args.output_dir)
@@ -1,7 +1,16 @@
 import logging
+import os
+import random
+import heapq
+import struct
+import tempfile
+import weakref
+from collections import OrderedDict, deque
+
 from utils import setup_logging
-from pipe_engine import Move, GROW, ROLLBACK
+from pipe_engine import GROW, SHRINK
 from empty_cells_checker_engine import EmptyCellsCheckerEngine
+from point import Point
 from samples import Samples
 
 # The biggest issue with the previous algorithms is that they always check new paths starting
@@ -12,60 +21,327 @@ from samples import Samples
 # All possible moves found when exploring are stored and assigned a total distance (the distance so far
 # + an estimation of the remaining distance)
 # We process all paths by increasing order of this distance, making it quicker to test shorter paths
+# The zones of empty cells reached after an explored path are kept until all its children are explored :
+# the zones after a child only differ by its last cell, so they are updated from the zones of the parent
+# instead of being searched again, and tell if the remaining pipes can still reach their ends.
+# With max_frontier, these zones count against the limit like the paths kept in memory : past the limit,
+# the oldest ones are evicted (their children are the furthest in the exploration order, and often spilled),
+# and the zones of their children are searched again when they are explored.
+
+# Spilled paths : distance, sequence number, depth and path length, followed by the (x, y) bytes of the path
+SPILL_RECORD = struct.Struct("<IQHH")
+SPILL_RATIO = 0.75  # fraction of max_entries left in memory after a spill
+MAX_RUNS = 8        # spilled runs of a pipe, past this number they are merged in a single run
+READ_ENTRIES = 64   # entries of a run read back from its file at once
+
+# Random 64-bit key of each cell, the cells of a path are hashed by xor-ing their keys (Zobrist hashing)
+ZOBRIST_KEYS = dict()
+
+# Pipe ordering modes
+STATIC_ORDERING = "static"                      # score pipes by walls and distance between their ends
+MOST_CONSTRAINED_ORDERING = "most-constrained"  # pick first the pipe with the fewest ways out of its ends
+
+
+def zobrist_key(point: Point) -> int:
+    if point not in ZOBRIST_KEYS:
+        # seeded by the coordinates, so the keys are the same in every process
+        ZOBRIST_KEYS[point] = random.Random(point.x * 65536 + point.y).getrandbits(64)
+    return ZOBRIST_KEYS[point]
+
+
+def cells_hash(path: list) -> int:
+    res = 0
+    for point in path:
+        res ^= zobrist_key(point)
+    return res
+
+
+def read_spill_entries(file_path: str, offset: int, limit: int = None):
+    """Entries of a run file from the offset, with the offset after each entry (up to limit entries)"""
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        while limit is None or limit > 0:
+            header = f.read(SPILL_RECORD.size)
+            if len(header) == 0:
+                return
+            (distance, seq, depth, length) = SPILL_RECORD.unpack(header)
+            coordinates = f.read(2 * length)
+            path = [Point(coordinates[2 * i], coordinates[2 * i + 1]) for i in range(length)]
+            yield (distance, seq, depth, path), f.tell()
+            if limit is not None:
+                limit -= 1
+
+
+def remove_spill_files(runs: dict, spill_dir: str):
+    """Remove the spilled runs, and the spill directory if it is a temporary directory left empty"""
+    for pipe_runs in runs.values():
+        for run in pipe_runs:
+            run.close()
+    runs.clear()
+    if spill_dir is not None and spill_dir.startswith(tempfile.gettempdir()) \
+            and os.path.isdir(spill_dir) and len(os.listdir(spill_dir)) == 0:
+        os.rmdir(spill_dir)
+
+
+class SpillRun:
+    """Entries of the possibles spilled to a file, sorted by (distance, sequence number) and read back lazily.
+    The file is only open while entries are written or read by blocks of READ_ENTRIES, so the number of runs
+    is not limited by the number of open files"""
+    def __init__(self, file_path: str, entries):
+        self.file_path = file_path
+        self.count = 0          # entries not read back yet
+        with open(file_path, "wb") as f:
+            for (distance, seq, depth, path) in entries:
+                f.write(SPILL_RECORD.pack(distance, seq, depth, len(path)))
+                f.write(bytes(coordinate for point in path for coordinate in (point.x, point.y)))
+                self.count += 1
+            self.size = f.tell()
+        self.offset = 0         # position in the file of the first entry not in the buffer
+        self.buffer = deque()   # next entries of the run with their size in the file
+        self.head = None        # next entry of the run, None when the run is over
+        self.head_size = 0      # size of the head entry in the file
+        self.read_next()
+
+    def read_next(self):
+        if len(self.buffer) == 0 and self.offset < self.size:
+            for (entry, offset) in read_spill_entries(self.file_path, self.offset, READ_ENTRIES):
+                self.buffer.append((entry, offset - self.offset))
+                self.offset = offset
+        if len(self.buffer) == 0:
+            self.head = None
+            self.close()
+            return
+        (self.head, self.head_size) = self.buffer.popleft()
+
+    def pop(self) -> tuple:
+        entry = self.head
+        self.count -= 1
+        self.read_next()
+        return entry
+
+    def remaining(self):
+        """All the entries not read yet, in order, read lazily from the file"""
+        if self.head is None:
+            return
+        yield self.head
+        for (entry, _size) in self.buffer:
+            yield entry
+        if self.offset < self.size:
+            for (entry, _offset) in read_spill_entries(self.file_path, self.offset):
+                yield entry
+
+    def close(self):
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
 
 
 class Possibles:
-    """A class to store all the possible moves not explored yet ordered by distance"""
-    def __init__(self):
+    """A class to store all the possible moves not explored yet ordered by distance.
+    Paths with the same distance are explored in the order they were added, so the order of the paths is
+    given by their (distance, sequence number).
+    If max_entries is set, when more paths are stored in memory the paths with the highest distances are
+    spilled to sorted run files, and read back lazily when they are the next ones to explore.
+    If dedup_size is set, a path covering the same cells and ending on the same head as a path already added
+    for the pipe is dropped : it leaves the grid in the same state, so exploring it again is wasted work.
+    The paths added are remembered in a table of dedup_size entries per pipe, the least recently used are evicted."""
+    def __init__(self, max_entries: int = None, spill_dir: str = None, dedup_size: int = None):
         self._possibles = dict()
+        self._runs = dict()  # pipe_id -> spilled runs
+        self._added = dict()  # pipe_id -> (cells hash, head) of the paths added, in least recently used order
+        self.dedup_size = dedup_size
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.entries = 0     # paths stored in memory
+        self.seq = 0         # sequence number of the next path added
+        self.stats = {"spills": 0, "spilled_entries": 0, "spilled_bytes": 0, "reloaded_entries": 0,
+                      "reloaded_bytes": 0, "merges": 0, "deduplicated": 0, "dedup_evictions": 0}
+        # removes the spilled runs when the possibles are garbage collected without close()
+        self._cleanup = None
 
     def exist(self, pipe_id: int) -> bool:
         return pipe_id in self._possibles
 
+    def size(self) -> int:
+        """Number of paths not explored yet, in memory or spilled"""
+        return self.entries + sum(run.count for runs in self._runs.values() for run in runs)
+
     def create(self, pipe_id: int):
         # estimation -> possible paths
         self._possibles[pipe_id] = dict()
+        if self.dedup_size is not None:
+            self._added[pipe_id] = OrderedDict()
 
     def delete(self, pipe_id: int):
+        self.entries -= sum(len(paths) for paths in self._possibles[pipe_id].values())
         del self._possibles[pipe_id]
+        self._added.pop(pipe_id, None)
+        for run in self._runs.pop(pipe_id, []):
+            run.close()
 
     def add(self, pipe_id, depth, estimation, path):
+        if self.dedup_size is not None and self.is_duplicate(pipe_id, path):
+            return
         distance = depth + estimation
         if distance not in self._possibles[pipe_id]:
             self._possibles[pipe_id][distance] = []
-        self._possibles[pipe_id][distance].append((depth, path))
+        self._possibles[pipe_id][distance].append((self.seq, depth, path))
+        self.seq += 1
+        self.entries += 1
+        if self.max_entries is not None and self.entries > self.max_entries:
+            self.spill()
+
+    def is_duplicate(self, pipe_id: int, path: list) -> bool:
+        """True if a path with the same cells and head was already added for this pipe, else remember this one"""
+        added = self._added[pipe_id]
+        key = (cells_hash(path), path[-1])
+        if key in added:
+            added.move_to_end(key)
+            self.stats["deduplicated"] += 1
+            return True
+        added[key] = None
+        if len(added) > self.dedup_size:
+            added.popitem(last=False)
+            self.stats["dedup_evictions"] += 1
+        return False
 
     def next(self, pipe_id):
         """Return the next unexplored path with the smallest distance for this pipe"""
         if pipe_id not in self._possibles:
             # only happens when there is no solution to the maze
             return -1, []
-        if len(self._possibles[pipe_id].keys()) == 0:
+        possibles = self._possibles[pipe_id]
+        runs = self._runs.get(pipe_id)
+        run = min(runs, key=lambda r: r.head[:2]) if runs else None
+        if len(possibles.keys()) == 0 and run is None:
             # no more possible move for this pipe, we will need to revert the previous one
             return -1, []
-        distance = min(self._possibles[pipe_id].keys())
-        res = self._possibles[pipe_id][distance].pop(0)
-        if len(self._possibles[pipe_id][distance]) == 0:
-            del self._possibles[pipe_id][distance]
+
+        distance = min(possibles.keys()) if len(possibles.keys()) > 0 else None
+        if run is not None and (distance is None or run.head[:2] < (distance, possibles[distance][0][0])):
+            # the next path was spilled
+            self.stats["reloaded_entries"] += 1
+            self.stats["reloaded_bytes"] += run.head_size
+            (distance, _seq, depth, path) = run.pop()
+            if run.head is None:
+                runs.remove(run)
+            res = (depth, path)
+        else:
+            (_seq, depth, path) = possibles[distance].pop(0)
+            if len(possibles[distance]) == 0:
+                del possibles[distance]
+            self.entries -= 1
+            res = (depth, path)
 
         logging.debug("Next path (DEPTH {0}, DISTANCE {1}) : {2}".format(res[0], distance, res[1]))
         return res
 
+    def spill(self):
+        """Move the paths with the highest distances of the biggest frontiers to disk, down to SPILL_RATIO"""
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="pipe-frontier-")
+        if self._cleanup is None:
+            self._cleanup = weakref.finalize(self, remove_spill_files, self._runs, self.spill_dir)
+        target = int(self.max_entries * SPILL_RATIO)
+        for pipe_id in sorted(self._possibles, key=lambda p: -sum(len(v) for v in self._possibles[p].values())):
+            possibles = self._possibles[pipe_id]
+            spilled = []
+            while self.entries > target and len(possibles) > 0:
+                distance = max(possibles.keys())
+                (seq, depth, path) = possibles[distance].pop()
+                if len(possibles[distance]) == 0:
+                    del possibles[distance]
+                spilled.append((distance, seq, depth, path))
+                self.entries -= 1
+            if len(spilled) > 0:
+                spilled.reverse()
+                runs = self._runs.setdefault(pipe_id, [])
+                run = SpillRun(os.path.join(self.spill_dir, "{0}-{1}.run".format(pipe_id, self.stats["spills"])),
+                               spilled)
+                runs.append(run)
+                self.stats["spills"] += 1
+                self.stats["spilled_entries"] += len(spilled)
+                self.stats["spilled_bytes"] += run.size
+                logging.debug("Spilled {0} paths of pipe {1} ({2} bytes)".format(len(spilled), pipe_id, run.size))
+                if len(runs) > MAX_RUNS:
+                    self.merge_runs(pipe_id)
+            if self.entries <= target:
+                return
+
+    def merge_runs(self, pipe_id: int):
+        """Merge the spilled runs of a pipe in a single run, so the next path is picked among few runs"""
+        runs = self._runs[pipe_id]
+        file_path = os.path.join(self.spill_dir, "{0}-merge-{1}.run".format(pipe_id, self.stats["merges"]))
+        # (distance, sequence number) is unique, so the entries are never compared on their paths
+        merged = SpillRun(file_path, heapq.merge(*[run.remaining() for run in runs]))
+        for run in runs:
+            run.close()
+        self._runs[pipe_id] = [merged]
+        self.stats["merges"] += 1
+        logging.debug("Merged {0} runs of pipe {1} ({2} bytes)".format(len(runs), pipe_id, merged.size))
+
+    def close(self):
+        """Remove the spilled runs"""
+        remove_spill_files(self._runs, self.spill_dir)
+
+    def __getstate__(self):
+        # the spilled paths are pickled in memory with the other paths, the runs are not
+        state = self.__dict__.copy()
+        possibles = {pipe_id: {distance: list(paths) for (distance, paths) in pipe_possibles.items()}
+                     for (pipe_id, pipe_possibles) in self._possibles.items()}
+        for (pipe_id, runs) in self._runs.items():
+            for run in runs:
+                for (distance, seq, depth, path) in run.remaining():
+                    possibles[pipe_id].setdefault(distance, []).append((seq, depth, path))
+                    state["entries"] += 1
+            for paths in possibles[pipe_id].values():
+                paths.sort(key=lambda entry: entry[0])
+        state["_possibles"] = possibles
+        state["_runs"] = dict()
+        state["spill_dir"] = None
+        state["_cleanup"] = None
+        return state
+
+
+class PrefixState:
+    """State derived from the grid after an explored path of the current pipe, kept while its children are explored"""
+    def __init__(self, labels: dict, pending: int):
+        self.labels = labels    # zone label of each empty cell
+        self.pending = pending  # children of the path in the possibles, not explored yet
+
 
 class ShortestPathEngine(EmptyCellsCheckerEngine):
-    def __init__(self, grid_size: int, pipe_ends: list):
+    def __init__(self, grid_size: int, pipe_ends: list, ordering: str = STATIC_ORDERING, bidirectional=False,
+                 max_frontier: int = None, dedup_size: int = None, hints: dict = None):
         super().__init__(grid_size, pipe_ends)
-        self.possibles = Possibles()
-
-    def next_moves(self) -> [Move]:
+        # max_frontier : maximum number of possible paths kept in memory, the others are spilled to disk
+        # dedup_size : number of paths remembered per pipe to drop the paths covering the same cells
+        # hints : original pipe id -> path of the pipe in a previous solution (warm start after a puzzle edit)
+        self.hints = hints or dict()
+        self.tried_hints = dict()  # pipe position -> hint explored for the pipe being processed
+        self.possibles = Possibles(max_frontier, dedup_size=dedup_size)
+        self.ordering = ordering
+        # if bidirectional, each pipe is grown from its most constrained end
+        # the ends of the pipes grown from their end are swapped in our own copy of pipe_ends
+        self.bidirectional = bidirectional
+        self.pipe_ends = list(pipe_ends)
+        self.flipped = set()
+        # zones of empty cells after the explored paths with children left to explore,
+        # for each pipe being processed : pipe position -> path -> PrefixState
+        self.prefix_states = dict()
+        self.prefix_evictions = 0  # prefix states dropped to stay within max_frontier
+        self.zone_labels = None  # zone label of each empty cell in the state being checked
+        self.next_label = 0
+
+    def step(self) -> bool:
         # if we can complete a pipe by following the wall, start with it
-        moves = self.begin_next_moves_hook()
-        if len(moves) > 0:
-            return moves
+        if self.begin_next_moves_hook():
+            return True
 
         # when we start a new pipe, try to pick one smartly
         if len(self.paths) == self.curr_pipe:
             self.choose_next_pipe()
+            if self.bidirectional:
+                self.choose_growth_end()
 
         original_pipe_id = self.original_id(self.curr_pipe)
         start = self.pipe_ends[original_pipe_id][0]
@@ -74,12 +350,18 @@ class ShortestPathEngine(EmptyCellsCheckerEngine):
         if len(self.paths) == self.curr_pipe:
             self.paths.append([(start, [])])
             self.possibles.create(self.curr_pipe)
+            self.prefix_states[self.curr_pipe] = dict()
+            self.zone_labels = self.label_zones()
             next_cells = self.possible_dirs(start, original_pipe_id)
-            next_cells = self.filter_next_cells(next_cells)
-
-            for next_cell in next_cells:
-                estimation = self.shortest_path(next_cell, target, original_pipe_id)
-                self.possibles.add(self.curr_pipe, 1, estimation, [start] + [next_cell])
+            next_cells = self.filter_next_cells(start, next_cells)
+            self.expand([start], 1, next_cells, target, original_pipe_id)
+            # the path of the pipe in the previous solution is explored before any other path (distance 0).
+            # If the hint leads nowhere, the search starts again without the hints (see drop_hints).
+            # Hints of 2 cells are skipped, the path to the adjacent target is explored first anyway
+            hint = self.consistent_hint(original_pipe_id)
+            if hint is not None and len(hint) > 2:
+                self.possibles.add(self.curr_pipe, 0, 0, hint)
+                self.tried_hints[self.curr_pipe] = hint
 
             # The pipe following the walls may have revealed some invalid state, if so roll them back
             if self.is_doomed():
@@ -89,9 +371,12 @@ class ShortestPathEngine(EmptyCellsCheckerEngine):
         depth, path_to_try = self.possibles.next(self.curr_pipe)
         if depth == -1:
             return self.rollback()
+        # the hint is the only path with a depth of 0, another path of a hinted pipe means that the hint failed
+        if depth > 0 and self.curr_pipe in self.tried_hints:
+            self.drop_hints()
+            return True
 
         # need to shrink them grow to reach the path to explore
-        set_of_moves = []
         keep = 0
         while len(path_to_try) > keep \
                 and len(self.paths[self.curr_pipe]) > keep \
@@ -99,64 +384,296 @@ class ShortestPathEngine(EmptyCellsCheckerEngine):
             keep += 1
         # the moves to keep are already as expected in self.paths, remove the next ones
         for i in range(0, len(self.paths[self.curr_pipe]) - keep):
-            set_of_moves += self.shrink()
+            self.shrink()
         # add the next points to reach the path to explore
         for i in range(keep, len(path_to_try)):
             self.universe[path_to_try[i].x, path_to_try[i].y] = str(original_pipe_id)
             self.paths[self.curr_pipe].append((path_to_try[i], []))
-            set_of_moves.append(Move(GROW, original_pipe_id, path_to_try[i]))
+            self.emit(GROW, original_pipe_id, path_to_try[i])
+
+        # follow the corridor : while the pipe head has a single way out, the pipe grows without adding
+        # its path to the possibles, so the search only branches and checks the grid at junction cells
+        self.zone_labels = self.prefix_labels(path_to_try)
+        next_cells = []
+        while path_to_try[-1] != target:
+            next_cells = self.filter_next_cells(path_to_try[-1], self.possible_dirs(path_to_try[-1], original_pipe_id))
+            if len(next_cells) != 1:
+                break
+            next_cell = next_cells[0]
+            self.universe[next_cell.x, next_cell.y] = str(original_pipe_id)
+            self.paths[self.curr_pipe].append((next_cell, []))
+            self.emit(GROW, original_pipe_id, next_cell)
+            self.split_zone(self.zone_labels, next_cell)
+            path_to_try = path_to_try + [next_cell]
+            depth += 1
+            self.corridor_cells += 1
 
         # now the universe is in the expected config
         # if it is already doomed, we do not add any further possibles
         if self.is_doomed():
-            return set_of_moves
+            return True
 
         # add the next possibles
         if path_to_try[-1] != target:
-            next_cells = self.possible_dirs(path_to_try[-1], original_pipe_id)
-            next_cells = self.filter_next_cells(next_cells)
-            for next_cell in next_cells:
-                estimation = self.shortest_path(next_cell, target, original_pipe_id)
-                self.possibles.add(self.curr_pipe, depth + 1, estimation, list(path_to_try) + [next_cell])
-            return set_of_moves
+            self.expand(path_to_try, depth + 1, next_cells, target, original_pipe_id)
         else:
             logging.debug("Reached the goal for pipe " + str(original_pipe_id))
             if self.curr_pipe < len(self.pipe_ends) - 1:
                 # move to next pipe
                 self.curr_pipe += 1
-                return set_of_moves
-            else:
+            elif self.add_solution():
                 logging.info("Pipe puzzle solved")
-                self.solved = True
                 self.display()
-                return set_of_moves
-
-    def rollback(self):
+                self.possibles.close()
+            # when enumerating the solutions, the next step explores the next possible path of the last pipe
+        return True
+
+    def expand(self, path: list, depth: int, next_cells: list, target: Point, original_pipe_id: int):
+        """Add the children of the explored path to the possibles, and keep the zones of the path for them"""
+        seq = self.possibles.seq
+        self.add_possibles(depth, path, next_cells, target, original_pipe_id)
+        if self.possibles.seq > seq:
+            self.prefix_states[self.curr_pipe][tuple(path)] = PrefixState(self.zone_labels, self.possibles.seq - seq)
+            if self.possibles.max_entries is not None:
+                self.evict_prefix_states()
+
+    def evict_prefix_states(self):
+        """Keep the prefix states and the paths in memory within max_frontier : past it, drop the prefix states of
+        the previous pipes (only needed after a rollback), then the oldest ones of the current pipe"""
+        limit = self.possibles.max_entries - self.possibles.entries
+        count = sum(len(states) for states in self.prefix_states.values())
+        if count <= limit:
+            return
+        target = int(limit * SPILL_RATIO)
+        for pipe_id in sorted(self.prefix_states):
+            states = self.prefix_states[pipe_id]
+            while count > target and len(states) > 0:
+                # dicts keep the insertion order, the first state is the oldest
+                del states[next(iter(states))]
+                count -= 1
+                self.prefix_evictions += 1
+            if count <= target:
+                return
+
+    def add_possibles(self, depth: int, path: list, next_cells: list, target: Point, original_pipe_id: int):
+        """Add to the possibles the current path of the pipe continued with each of the next cells"""
+        distances = self.distances_to(target, next_cells)
+        for next_cell in next_cells:
+            self.possibles.add(self.curr_pipe, depth, distances.get(next_cell, -1), list(path) + [next_cell])
+
+    def distances_to(self, target: Point, cells: list) -> dict:
+        """Distance of each cell to the target through the empty cells, with a single BFS from the target
+        stopped when all the cells are reached (unreachable cells are missing)"""
+        remaining = set(cells)
+        distances = dict()
+        seen = {target}
+        front = [target]
+        distance = 0
+        while len(front) > 0 and len(remaining) > 0:
+            next_front = []
+            for p in front:
+                if p in remaining:
+                    distances[p] = distance
+                    remaining.discard(p)
+                for adj in p.adjacent_points():
+                    if adj not in seen and self.universe[adj.x, adj.y] == '.':
+                        seen.add(adj)
+                        next_front.append(adj)
+            front = next_front
+            distance += 1
+        return distances
+
+    def exist_path(self, p1: Point, p2: Point, pipe_id: int) -> bool:
+        if self.zone_labels is None:
+            return super().exist_path(p1, p2, pipe_id)
+        # p2 is reachable from p1 if they are adjacent or if they touch the same zone of empty cells
+        if p1 == p2 or p2 in p1.adjacent_points():
+            return True
+        zones = {self.zone_labels[p] for p in p1.adjacent_points() if p in self.zone_labels}
+        return any(self.zone_labels.get(p) in zones for p in p2.adjacent_points())
+
+    def prefix_labels(self, path: list) -> dict:
+        """Zone labels of the empty cells after the path, from the zones of its parent path if they are kept"""
+        states = self.prefix_states.get(self.curr_pipe, dict())
+        parent = tuple(path[:-1])
+        if parent not in states:
+            return self.label_zones()
+        state = states[parent]
+        state.pending -= 1
+        if state.pending == 0:
+            # all the children of the parent path are explored
+            del states[parent]
+        return self.fill_cell(state.labels, path[-1])
+
+    def label_zones(self) -> dict:
+        """Zone label of each empty cell of the grid"""
+        labels = dict()
+        for ((x, y), symbol) in self.universe.items():
+            if symbol == '.' and Point(x, y) not in labels:
+                self.flood_zone(labels, Point(x, y), None, set())
+        return labels
+
+    def fill_cell(self, parent_labels: dict, cell: Point) -> dict:
+        """Zone labels after filling an empty cell, the labels of the parent are not modified"""
+        labels = dict(parent_labels)
+        self.split_zone(labels, cell)
+        return labels
+
+    def split_zone(self, labels: dict, cell: Point):
+        """Update the labels when an empty cell is filled : only its zone can split, between the neighbours of the cell"""
+        zone = labels.pop(cell, None)
+        neighbours = [p for p in cell.adjacent_points() if zone is not None and labels.get(p) == zone]
+        while len(neighbours) > 1:
+            # the zone is still connected if the other neighbours are reached from the first one,
+            # else the part reached gets a new label and the other neighbours are checked again
+            reached = self.flood_zone(labels, neighbours[0], zone, set(neighbours[1:]))
+            neighbours = [p for p in neighbours[1:] if p not in reached]
+
+    def flood_zone(self, labels: dict, origin: Point, zone, targets: set) -> set:
+        """BFS over the empty cells labelled zone (unlabelled empty cells if zone is None) from the origin.
+        Stop when all the targets are reached, else give a new label to the cells reached"""
+        reached = {origin}
+        to_process = deque([origin])
+        while len(to_process) > 0:
+            p = to_process.popleft()
+            targets.discard(p)
+            if len(targets) == 0 and zone is not None:
+                return reached
+            for adj in p.adjacent_points():
+                if adj not in reached and (labels.get(adj) == zone if zone is not None
+                                           else adj not in labels and self.universe[adj.x, adj.y] == '.'):
+                    reached.add(adj)
+                    to_process.append(adj)
+        for p in reached:
+            labels[p] = self.next_label
+        self.next_label += 1
+        return reached
+
+    def frontier_size(self) -> int:
+        return self.possibles.size()
+
+    def rollback(self) -> bool:
         # On rollback of a pipe explored with this engine, we need to revert this path and all the previous
         # pipes that were generated automatically because they follow a wall
         logging.debug("We are blocked, rollback the last pipe and the previous ones following walls")
         logging.debug(self.display())
         if self.curr_pipe < 0:
             # No solution
-            return []
+            return False
         self.possibles.delete(self.curr_pipe)
+        self.prefix_states.pop(self.curr_pipe, None)
+        self.tried_hints.pop(self.curr_pipe, None)
 
         # no more possible moves for this pipe so roll it back entirely
-        set_of_moves = self.shrink()
-        while set_of_moves[-1].move_type != ROLLBACK:
-            set_of_moves += self.shrink()
+        move_type = self.shrink()
+        while move_type == SHRINK:
+            move_type = self.shrink()
+        if move_type is None:
+            # we reverted up to the very first pipe, so there is no solution
+            return False
 
         # also rollback the previous pipes if they were following the walls
         while not self.possibles.exist(self.curr_pipe):
-            moves_to_revert_next_pipe = self.shrink()
-            set_of_moves += moves_to_revert_next_pipe
-            if len(moves_to_revert_next_pipe) == 0:
+            if self.shrink() is None:
                 # we reverted up to the very first pipe, so there is no solution
                 break
 
-        return set_of_moves
+        return True
+
+    def choose_growth_end(self):
+        # grow the pipe from its end if it has fewer ways out than its start, so the frontier of possible
+        # paths stays small until the constrained end is passed.
+        # Pipes with ends closer than 3 cells are not flipped, so the GUI can always tell from the first cell
+        # grown which end the pipe grows from.
+        original_pipe_id = self.original_id(self.curr_pipe)
+        start, target = self.pipe_ends[original_pipe_id]
+        if abs(start.x - target.x) + abs(start.y - target.y) < 3:
+            return
+        start_exits = len([p for p in start.adjacent_points() if self.universe[p.x, p.y] == '.'])
+        target_exits = len([p for p in target.adjacent_points() if self.universe[p.x, p.y] == '.'])
+        if target_exits < start_exits:
+            logging.debug("Growing pipe {0} from its other end".format(original_pipe_id))
+            self.pipe_ends[original_pipe_id] = (target, start)
+            self.flipped ^= {original_pipe_id}
+
+    # override to report the flipped pipes from their original start
+    def final_paths(self):
+        paths = super().final_paths()
+        for pipe_id in self.flipped:
+            if pipe_id < len(paths) and paths[pipe_id][-1][0] == self.pipe_ends[pipe_id][1]:
+                paths[pipe_id] = paths[pipe_id][::-1]
+        return paths
+
+    def consistent_hint(self, original_pipe_id: int):
+        """Path of the hint of the pipe from its start, if it still connects its ends through empty cells, else None.
+        The hints are not used when enumerating the solutions, the search restarted without them would find
+        the hinted solution again"""
+        hint = self.hints.get(original_pipe_id)
+        if hint is None or len(hint) < 2 or self.enumerating():
+            return None
+        (start, target) = self.pipe_ends[original_pipe_id]
+        if hint[0] == target and hint[-1] == start:
+            # the pipe grows from its end
+            hint = hint[::-1]
+        if hint[0] != start or hint[-1] != target:
+            return None
+        for i in range(1, len(hint)):
+            if hint[i] not in hint[i - 1].adjacent_points():
+                return None
+            if i < len(hint) - 1 and self.universe[hint[i].x, hint[i].y] != '.':
+                return None
+        return list(hint)
+
+    def drop_hints(self):
+        """Forget the hints and start the search again from the empty grid, like a solve without hints.
+        The pipes placed with their hints were processed first, and a full search of the other pipes in this
+        order can be much slower than in the usual order, so their other paths are not searched"""
+        logging.debug("The hint of pipe {0} failed, solving again without the hints".format(
+            self.original_id(self.curr_pipe)))
+        while self.shrink() is not None:
+            pass
+        for pipe_id in self.prefix_states:
+            self.possibles.delete(pipe_id)
+        self.prefix_states.clear()
+        self.tried_hints.clear()
+        self.hints = dict()
+        self.zone_labels = None
+        self.curr_pipe = 0
+        self.pipes_mapping = [i for i in range(len(self.pipe_ends))]
+        self.pipes_positions = [i for i in range(len(self.pipe_ends))]
+        for pipe_id in self.flipped:
+            self.pipe_ends[pipe_id] = self.pipe_ends[pipe_id][::-1]
+        self.flipped = set()
+        # the empty cells of the last checked state are computed again
+        self.checked_pipes = None
+        self.unchecked_cells.clear()
+        self.uncut_cells.clear()
+
+    def hinted_pipe(self):
+        """First remaining pipe with a consistent hint, None if there is none"""
+        for i in range(self.curr_pipe, len(self.pipe_ends)):
+            if self.consistent_hint(self.original_id(i)) is not None:
+                return i
+        return None
 
     def choose_next_pipe(self):
+        # the pipes that keep the path of the previous solution are placed first,
+        # so the other pipes are searched in the cells left by them
+        hinted_pipe = self.hinted_pipe() if len(self.hints) > 0 else None
+        if hinted_pipe is not None:
+            best_pipe = hinted_pipe
+        elif self.ordering == MOST_CONSTRAINED_ORDERING:
+            best_pipe = self.most_constrained_pipe()
+        else:
+            best_pipe = self.best_scored_pipe()
+
+        logging.debug("Choosing next pipe {0}".format(self.original_id(best_pipe)))
+
+        # flip the next pipe with the one we want to process
+        if best_pipe != self.curr_pipe:
+            self.swap_pipes(best_pipe, self.curr_pipe)
+
+    def best_scored_pipe(self) -> int:
         # instead of picking the next pipe in the list, try to select one in a smart way.
         # We give a score to all pipes and pick the one with the best score :
         # - higher score for pipes against the wall, ideally in a corner
@@ -184,14 +701,33 @@ class ShortestPathEngine(EmptyCellsCheckerEngine):
             if score > best_score:
                 best_pipe = i
                 best_score = score
-
-        logging.debug("Choosing next pipe {0}".format(self.original_id(best_pipe)))
-
-        # flip the next pipe with the one we want to process
-        if best_pipe != self.curr_pipe:
-            original_best_pipe_id = self.pipes_mapping[best_pipe]
-            self.pipes_mapping[best_pipe] = self.pipes_mapping[self.curr_pipe]
-            self.pipes_mapping[self.curr_pipe] = original_best_pipe_id
+        return best_pipe
+
+    def most_constrained_pipe(self) -> int:
+        # fail-first ordering : pick the pipe with the fewest possible continuations, so a wrong state is
+        # spotted before investing in other pipes.
+        # The constraint of a pipe only depends on the cells around its ends, so it is cheap to compute
+        # and the pipes are ranked again every time a pipe is completed :
+        # - fewest free cells next to its most constrained end
+        # - then fewest free cells next to both ends
+        # - then narrowest corridor around its ends (free cells in the 3x3 squares around them)
+        # - then longest pipe
+        best_key = None
+        best_pipe = self.curr_pipe
+        for i in range(self.curr_pipe, len(self.pipe_ends)):
+            original_pipe_id = self.original_id(i)
+            start, target = self.pipe_ends[original_pipe_id]
+            start_exits = len(self.possible_dirs(start, original_pipe_id))
+            target_exits = len([p for p in target.adjacent_points()
+                                if self.universe[p.x, p.y] == '.' or p == start])
+            corridor = len([(x, y) for p in (start, target) for x in (p.x - 1, p.x, p.x + 1)
+                            for y in (p.y - 1, p.y, p.y + 1) if self.universe[x, y] == '.'])
+            span = abs(start.x - target.x) + abs(start.y - target.y)
+            key = (min(start_exits, target_exits), start_exits + target_exits, corridor, -span)
+            if best_key is None or key < best_key:
+                best_pipe = i
+                best_key = key
+        return best_pipe
 
 
 if __name__ == "__main__":
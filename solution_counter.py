@@ -0,0 +1,70 @@
+import logging
+from multiprocessing import Pool
+
+from utils import setup_logging
+from shortest_path_engine import ShortestPathEngine
+from samples import Samples
+
+# Count the solutions of a puzzle, to check that a generated puzzle has a unique solution.
+# The engine keeps searching after a solution instead of stopping at the first one (max_solutions),
+# and stops as soon as the limit is reached : a uniqueness check only needs to know if there are 2 solutions.
+# A solution covers the whole grid, and none of its pipes touches itself : all the pruning of the engines
+# (holes, loops, unreachable pipe ends) is sound for those solutions, except the wall-following shortcut
+# which is disabled while enumerating.
+#
+# With several processes, the search tree is split on the first cell of the first pipe :
+# each process explores one of the (up to 4) branches, and all are terminated once the limit is reached.
+
+DEFAULT_LIMIT = 2
+BRANCHES = 4  # maximum number of first cells of a pipe
+
+
+def count_branch(engine_factory, grid_size: int, pipe_ends: list, limit, branch) -> int:
+    """Number of solutions (up to limit) with the given branch for the first cell of the first pipe"""
+    engine = engine_factory(grid_size, pipe_ends)
+    engine.max_solutions = limit
+    if branch is not None:
+        filter_next_cells = engine.filter_next_cells
+
+        def filter_branch(head, points):
+            points = filter_next_cells(head, points)
+            if engine.curr_pipe == 0 and len(engine.paths[0]) == 1:
+                # first expansion of the first pipe, only keep the cell of this branch
+                return points[branch:branch + 1]
+            return points
+        engine.filter_next_cells = filter_branch
+    engine.run_to_completion()
+    return len(engine.solutions)
+
+
+def count_branch_task(task: tuple) -> int:
+    return count_branch(*task)
+
+
+def count_solutions(grid_size: int, pipe_ends: list, limit=DEFAULT_LIMIT, processes: int = 1,
+                    engine_factory=ShortestPathEngine) -> int:
+    """Number of solutions of a puzzle, up to limit (None to count them all).
+    With several processes, engine_factory must build a ShortestPathEngine (or a child class)."""
+    if processes <= 1:
+        return count_branch(engine_factory, grid_size, pipe_ends, limit, None)
+
+    tasks = [(engine_factory, grid_size, pipe_ends, limit, branch) for branch in range(BRANCHES)]
+    count = 0
+    # leaving the pool terminates the processes still searching
+    with Pool(min(processes, BRANCHES)) as pool:
+        for branch_count in pool.imap_unordered(count_branch_task, tasks):
+            count += branch_count
+            if limit is not None and count >= limit:
+                return limit
+    return count
+
+
+def has_unique_solution(grid_size: int, pipe_ends: list, processes: int = 1) -> bool:
+    return count_solutions(grid_size, pipe_ends, 2, processes) == 1
+
+
+if __name__ == "__main__":
+    setup_logging(logging.INFO)
+    for name in ["4", "5", "6", "7", "8", "9", "10"]:
+        (size, pipes) = Samples.get_puzzle(name)
+        logging.info("Sample {0} : {1} solution(s)".format(name, count_solutions(size, pipes, None, processes=4)))
@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, CancelledError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from utils import setup_logging
+from shortest_path_engine import ShortestPathEngine
+from puzzle_io import puzzle_from_json, paths_to_json
+
+# Local HTTP/JSON solving service :
+#  - POST /solve with a puzzle in the SAMPLES shape ({"size": 5, "pipes": [[[0, 4], [2, 3]], ...]}),
+#    and optionally a "deadline" in seconds, returns {"status": "solved", "paths": [...]}
+#  - GET /stats returns the queue depth, the p50/p99 latencies and the number of solves per second
+#
+# Puzzles are solved by a pool of worker processes, started when the server starts so the engines are already
+# imported when the first request comes in.
+# Concurrent identical requests are coalesced : they all wait for the result of a single solve.
+# A request only joins a solve in progress that gives up at the same time or later than the request itself,
+# else the solve could time out before the deadline of the request.
+# The give up time is a wall clock time set when the request comes in, so the time spent in the queue of the pool
+# counts : a worker does not start a solve whose requests already timed out, and a queued solve is cancelled
+# when its last waiting request times out.
+
+DEFAULT_PORT = 8421
+DEFAULT_DEADLINE = 30.0     # seconds
+MAX_DEADLINE = 600.0        # seconds
+LATENCY_WINDOW = 1000       # number of latest requests used for the latency percentiles
+THROUGHPUT_WINDOW = 60.0    # seconds used to compute the solves per second
+
+# Solve status
+SOLVED = "solved"
+NO_SOLUTION = "no_solution"
+TIMEOUT = "timeout"
+
+
+def warm_up():
+    """Run once in each worker process, so it is started and has the engines loaded before any request"""
+    return os.getpid()
+
+
+def solve_puzzle(puzzle: dict, give_up_time: float) -> dict:
+    """Solve a JSON puzzle in a worker process, giving up at a wall clock time (time.time())"""
+    time_left = give_up_time - time.time()
+    if time_left <= 0:
+        # the requests timed out while the solve was waiting for a worker
+        return {"status": TIMEOUT}
+    (grid_size, pipe_ends) = puzzle_from_json(puzzle)
+    engine = ShortestPathEngine(grid_size, pipe_ends)
+    if engine.run_to_completion(time.monotonic() + time_left):
+        return {"status": SOLVED, "paths": paths_to_json(engine.final_paths())}
+    return {"status": NO_SOLUTION if engine.exhausted else TIMEOUT}
+
+
+class SolverService:
+    """Pool of workers shared by the request handlers, with the coalescing of identical requests"""
+    def __init__(self, workers: int):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        # start all the workers now
+        for future in [self.pool.submit(warm_up) for _ in range(workers)]:
+            future.result()
+        self.lock = threading.RLock()
+        self.in_flight = dict()  # puzzle key -> (future, give up time) of the latest solve in progress
+        self.waiters = dict()    # future of a solve -> number of requests waiting for it
+        self.solving = 0         # solves submitted and not done
+        self.waiting = 0         # requests waiting for a solve
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.solve_times = deque()  # end time of the latest solves
+        self.coalesced = 0
+
+    def solve(self, puzzle: dict, deadline: float) -> dict:
+        start = time.monotonic()
+        key = json.dumps(puzzle, sort_keys=True)
+        give_up_time = time.time() + deadline
+        with self.lock:
+            (future, solve_give_up_time) = self.in_flight.get(key, (None, None))
+            if future is None or solve_give_up_time < give_up_time:
+                future = self.pool.submit(solve_puzzle, puzzle, give_up_time)
+                self.in_flight[key] = (future, give_up_time)
+                self.solving += 1
+                future.add_done_callback(lambda done_future: self.on_solve_done(key, done_future))
+            else:
+                self.coalesced += 1
+            self.waiters[future] = self.waiters.get(future, 0) + 1
+            self.waiting += 1
+        try:
+            return future.result(timeout=deadline)
+        except (TimeoutError, CancelledError):
+            return {"status": TIMEOUT}
+        finally:
+            with self.lock:
+                self.waiting -= 1
+                self.waiters[future] -= 1
+                if self.waiters[future] == 0:
+                    del self.waiters[future]
+                    # nobody waits for this solve any more, free its worker slot if it did not start yet
+                    future.cancel()
+                self.latencies.append(time.monotonic() - start)
+
+    def on_solve_done(self, key: str, future):
+        with self.lock:
+            # a solve with a later deadline may have replaced this one
+            if self.in_flight.get(key, (None, None))[0] is future:
+                del self.in_flight[key]
+            self.solving -= 1
+            self.solve_times.append(time.monotonic())
+
+    def stats(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            while len(self.solve_times) > 0 and self.solve_times[0] < now - THROUGHPUT_WINDOW:
+                self.solve_times.popleft()
+            latencies = sorted(self.latencies)
+            return {
+                "queue_depth": self.solving,
+                "waiting_requests": self.waiting,
+                "coalesced_requests": self.coalesced,
+                "latency_p50": percentile(latencies, 0.50),
+                "latency_p99": percentile(latencies, 0.99),
+                "solves_per_second": len(self.solve_times) / THROUGHPUT_WINDOW,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def percentile(sorted_values: list, ratio: float):
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(ratio * len(sorted_values)))]
+
+
+class SolverRequestHandler(BaseHTTPRequestHandler):
+    service: SolverService = None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {"error": "Unknown path " + self.path})
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self.send_json(404, {"error": "Unknown path " + self.path})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            puzzle = {"size": body.get("size"), "pipes": body.get("pipes")}
+            puzzle_from_json(puzzle)
+            deadline = float(body.get("deadline", DEFAULT_DEADLINE))
+            if not 0 < deadline <= MAX_DEADLINE:
+                # also rejects NaN and infinity
+                raise ValueError("The deadline must be a number of seconds in ]0, {0}]".format(MAX_DEADLINE))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        result = self.service.solve(puzzle, deadline)
+        self.send_json(504 if result["status"] == TIMEOUT else 200, result)
+
+    def send_json(self, code: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format, *args):
+        logging.debug(message_format % args)
+
+
+def create_server(port: int = DEFAULT_PORT, workers: int = None) -> ThreadingHTTPServer:
+    SolverRequestHandler.service = SolverService(workers or os.cpu_count())
+    return ThreadingHTTPServer(("localhost", port), SolverRequestHandler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP pipe puzzle solving service")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    server = create_server(args.port, args.workers)
+    logging.info("Listening on http://localhost:{0}".format(args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SolverRequestHandler.service.shutdown()
@@ -1,4 +1,12 @@
 import logging
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
 
 
 def setup_logging(level=logging.DEBUG):
@@ -6,3 +14,16 @@ def setup_logging(level=logging.DEBUG):
         format='[%(levelname)-7s] %(asctime)s %(message)s',
         datefmt='%m/%d/%Y %I:%M:%S %p',
         level=level)
+
+
+def process_rss() -> int:
+    """Resident memory of the process in bytes, or its peak resident memory where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        if resource is None:
+            return 0
+        # ru_maxrss is in bytes on Mac OS, in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
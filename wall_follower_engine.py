@@ -1,39 +1,80 @@
 import logging
+from typing import Optional
 
 from utils import setup_logging
-from pipe_engine import Move, GROW
+from pipe_engine import GROW
 from point import Point, LEFT, UP, RIGHT, DOWN
 from path_checker_engine import PathCheckerEngine
 
 
+class WallContour:
+    """Succession of points against the wall from a pipe start, and the pipes ends found on it"""
+    def __init__(self, sequence: [Point], pipes_on_walls: [int]):
+        self.sequence = sequence
+        self.pipes_on_walls = pipes_on_walls
+        # cells whose wall status was used to build the contour
+        self.area = {(p.x + i, p.y + j) for p in sequence for i in (-1, 0, 1) for j in (-1, 0, 1)}
+
+
 class WallFollowerEngine(PathCheckerEngine):
     def __init__(self, grid_size: int, pipe_ends: list):
         super().__init__(grid_size, pipe_ends)
+        # index of the wall contours for each number of completed pipes :
+        # the contours only change when a pipe is completed or rolled back, so they are computed
+        # once and reused until one of the cells around them becomes a wall
+        self.wall_contours = []
 
-    def begin_next_moves_hook(self) -> [Move]:
+    def begin_next_moves_hook(self) -> bool:
         # when we start a new pipe, we first check if there is a pipe that can be connected
         # simply by following the walls
-        if len(self.paths) == self.curr_pipe:
+        # this shortcut skips the other paths of the pipe, so it is not used when enumerating the solutions
+        if len(self.paths) == self.curr_pipe and not self.enumerating():
             (pipe_id, moves) = self.next_pipe_path_along_walls()
             if pipe_id != -1:
                 # A pipe can be connected by following the wall, process it first
-                current_index_of_pipe_id = self.pipes_mapping.index(pipe_id)
-                self.pipes_mapping[current_index_of_pipe_id] = self.pipes_mapping[self.curr_pipe]
-                self.pipes_mapping[self.curr_pipe] = pipe_id
+                self.swap_pipes(self.position(pipe_id), self.curr_pipe)
                 start = self.pipe_ends[pipe_id][0]
 
                 self.paths.append([(start, [])])
                 for move in moves:
                     self.universe[move.x, move.y] = str(pipe_id)
                     self.paths[self.curr_pipe].append((move, []))
+                    self.emit(GROW, pipe_id, move)
                 self.curr_pipe += 1
-                return [Move(GROW, pipe_id, move) for move in moves]
-        return []
+                return True
+        return False
 
     def is_wall(self, p: Point):
         symbol = self.universe[(p.x, p.y)]
         # pipes already completed count as walls
-        return symbol == '#' or (symbol != '.' and self.pipes_mapping.index(int(symbol)) < self.curr_pipe)
+        return symbol == '#' or (symbol != '.' and self.position(int(symbol)) < self.curr_pipe)
+
+    def shrink(self) -> Optional[str]:
+        move_type = super().shrink()
+        # on rollback the last completed pipe changes, so the contours computed after it are outdated
+        del self.wall_contours[self.curr_pipe + 1:]
+        return move_type
+
+    def current_wall_contours(self) -> dict:
+        """Wall contours (indexed by origin point) for the pipes completed so far"""
+        while len(self.wall_contours) <= self.curr_pipe:
+            completed = len(self.wall_contours)
+            if completed == 0:
+                self.wall_contours.append(dict())
+                continue
+            # keep the contours far enough from the cells of the last completed pipe
+            new_walls = {(p.x, p.y) for (p, _moves) in self.paths[completed - 1]}
+            self.wall_contours.append({origin: contour for (origin, contour) in self.wall_contours[-1].items()
+                                       if contour.area.isdisjoint(new_walls)})
+        return self.wall_contours[self.curr_pipe]
+
+    def get_wall_contour(self, origin: Point) -> WallContour:
+        contours = self.current_wall_contours()
+        if origin not in contours:
+            sequence = self.get_wall_sequence(origin)
+            pipes_on_walls = [int(self.universe[p.x, p.y]) for p in sequence if self.universe[p.x, p.y] != '.']
+            contours[origin] = WallContour(sequence, pipes_on_walls)
+        return contours[origin]
 
     def get_wall_sequence(self, origin: Point):
         """Succession of points against the wall starting from a given point"""
@@ -82,14 +123,9 @@ class WallFollowerEngine(PathCheckerEngine):
                 continue
 
             # get the sequence of points against the wall (first and last are the start point)
-            wall_sequence = self.get_wall_sequence(start)
-            pipes_on_walls = []
-            for point in wall_sequence:
-                symbol = self.universe[point.x, point.y]
-                if symbol == '.':
-                    continue
-                else:
-                    pipes_on_walls.append(int(symbol))
+            contour = self.get_wall_contour(start)
+            wall_sequence = contour.sequence
+            pipes_on_walls = contour.pipes_on_walls
 
             if pipes_on_walls.count(original_pipe_id) != 3:
                 # the start of the pipe is at the beginning and at the end, if we also have the end it makes 3
@@ -120,6 +156,10 @@ class WallFollowerEngine(PathCheckerEngine):
                     if self.universe[point.x, point.y] == str(original_pipe_id):
                         break
 
+            if len(set(moves)) != len(moves):
+                # the wall goes in and out of a dead end 1 cell wide, a pipe cannot visit a cell twice
+                continue
+
             return original_pipe_id, moves
 
         # No pipe to process following the walls